@@ -0,0 +1,243 @@
+"""On-chain trade feed: eth_subscribe to Seaport fills, ERC-721 transfers and new heads."""
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+from eth_abi import decode as abi_decode
+
+from . import scan_scheduler, trade_store
+from .config import contracts, settings
+from .moralis_async import _loop
+from .runtime import log
+
+# Seaport 1.5 and 1.6 share the OrderFulfilled signature.
+SEAPORT_ADDRESSES = [
+    "0x00000000000000ADc04C56Bf30aC9d3c0aAF14dC",
+    "0x0000000000000068F116a894984e2DB1123eB395",
+]
+ORDER_FULFILLED_TOPIC = "0x9d9af8e38d66c62e2c12f0225249fd9d721c54b83f48d9352c97c6cacdcb6f31"
+TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+
+# OrderFulfilled data: orderHash, recipient, SpentItem[] offer, ReceivedItem[] consideration
+_ORDER_FULFILLED_TYPES = ("bytes32", "address", "(uint8,address,uint256,uint256)[]",
+                          "(uint8,address,uint256,uint256,address)[]")
+
+_ITEM_NATIVE, _ITEM_ERC20, _ITEM_ERC721, _ITEM_ERC1155 = 0, 1, 2, 3
+
+# Wrapped ether per chain: ERC-20 payments in it are priced as ETH.
+_WETH = {
+    "0xc02aaa39b223fe8d0a0e5c4f27ead9083c756cc2",
+    "0x7ceb23fd6bc0add59e62ac25578270cff1b9f619",
+}
+
+_state: Dict[str, Any] = {
+    "future": None,
+    "connected": False,
+    "url": None,
+    "head": None,
+    "fills": 0,
+    "transfers": 0,
+    "error": None,
+}
+_last_transfer: Dict[str, float] = {}
+_block_ts: "OrderedDict[int, float]" = OrderedDict()
+_BLOCK_TS_MAX = 256
+
+
+def ws_url() -> Optional[str]:
+    """RPC_WS_URL, else the first ws:// or wss:// endpoint among RPC_URL/RPC_URLS."""
+    from .rpc_pool import configured_urls
+
+    explicit = getattr(settings, "RPC_WS_URL", "") or ""
+    if explicit:
+        return explicit
+    return next((u for u in configured_urls() if u.lower().startswith(("ws://", "wss://"))), None)
+
+
+def _topic_address(topic: str) -> str:
+    return "0x" + topic[-40:]
+
+
+def _int(value: Any) -> int:
+    return int(value, 16) if isinstance(value, str) else int(value)
+
+
+def _note_head(header: Dict[str, Any]) -> None:
+    number = _int(header["number"])
+    _block_ts[number] = float(_int(header["timestamp"]))
+    while len(_block_ts) > _BLOCK_TS_MAX:
+        _block_ts.popitem(last=False)
+    _state["head"] = number
+
+
+def _usd(amount_wei: int, asset: str) -> Optional[float]:
+    from .pricing import price_usd
+
+    px = price_usd(asset)
+    return (amount_wei / 1e18) * px if px else None
+
+
+def decode_fill(
+    entry: Dict[str, Any], watched: Iterable[str], ts: Optional[float] = None
+) -> List[Dict[str, Any]]:
+    """
+    Seaport OrderFulfilled log -> trade records for NFTs of watched contracts.
+    A listing fill offers the NFT (offerer sells to recipient); an accepted bid
+    offers currency (offerer buys from recipient). ``ts`` is the block time,
+    looked up among recent heads when omitted. The price travels only as
+    ``price_usd`` (None while no ETH price is known, never the wei amount,
+    which the normalizer would take for USD). Records carry no log index:
+    Moralis numbers the same sale differently, so the trade store matches
+    them by (tx hash, token).
+    """
+    topics = entry.get("topics") or []
+    if len(topics) < 3 or topics[0].lower() != ORDER_FULFILLED_TOPIC:
+        return []
+    _, recipient, offer, consideration = abi_decode(_ORDER_FULFILLED_TYPES, bytes.fromhex(entry["data"][2:]))
+    offerer = _topic_address(topics[1])
+    watched = {c.lower() for c in watched}
+    offered_nfts = [i for i in offer if i[0] in (_ITEM_ERC721, _ITEM_ERC1155) and i[1].lower() in watched]
+    wanted_nfts = [i for i in consideration if i[0] in (_ITEM_ERC721, _ITEM_ERC1155) and i[1].lower() in watched]
+    if offered_nfts:
+        nfts, seller, buyer = offered_nfts, offerer, recipient
+        payments = [(i[0], i[1], i[3]) for i in consideration if i[0] in (_ITEM_NATIVE, _ITEM_ERC20)]
+    elif wanted_nfts:
+        nfts, seller, buyer = wanted_nfts, recipient, offerer
+        payments = [(i[0], i[1], i[3]) for i in offer if i[0] in (_ITEM_NATIVE, _ITEM_ERC20)]
+    else:
+        return []
+    native = sum(amount for kind, _, amount in payments if kind == _ITEM_NATIVE)
+    weth = sum(amount for kind, token, amount in payments if kind == _ITEM_ERC20 and token.lower() in _WETH)
+    usd = None
+    if native:
+        usd = _usd(native, settings.CHAIN)
+    if weth:
+        usd = (usd or 0.0) + (_usd(weth, "eth") or 0.0)
+    block = _int(entry["blockNumber"])
+    ts = ts or _block_ts.get(block) or time.time()
+    share = 1.0 / len(nfts)
+    records = []
+    for item in nfts:
+        records.append({
+            "transaction_hash": entry["transactionHash"],
+            "block_number": block,
+            "block_timestamp": ts,
+            "buyer_address": buyer,
+            "seller_address": seller,
+            "token_address": item[1],
+            "token_ids": [str(item[2])],
+            "price_usd": usd * share if usd else None,
+            "marketplace": "opensea",
+            "source": "chain-logs",
+        })
+    return records
+
+
+def _handle(kind: str, result: Dict[str, Any], watched: List[str]) -> None:
+    if kind == "newHeads":
+        _note_head(result)
+        return
+    if result.get("removed"):
+        return  # reorged out; the next poll reconciles history
+    if kind == "transfers":
+        _state["transfers"] += 1
+        contract = str(result.get("address", "")).lower()
+        _last_transfer[contract] = time.time()
+        scan_scheduler.scheduler.bump(contract)
+        return
+    for record in decode_fill(result, watched):
+        _state["fills"] += 1
+        trade_store.ingest(record["token_address"], [record], source="chain")
+
+
+async def _session(url: str, watched: List[str]) -> None:
+    import websockets
+
+    requests = {
+        1: ("fills", ["logs", {"address": SEAPORT_ADDRESSES, "topics": [ORDER_FULFILLED_TOPIC]}]),
+        2: ("transfers", ["logs", {"address": watched, "topics": [TRANSFER_TOPIC]}]),
+        3: ("newHeads", ["newHeads"]),
+    }
+    async with websockets.connect(url, ping_interval=20, open_timeout=15, max_size=2 ** 25) as ws:
+        for req_id, (_, params) in requests.items():
+            await ws.send(json.dumps({"jsonrpc": "2.0", "id": req_id, "method": "eth_subscribe", "params": params}))
+        subs: Dict[str, str] = {}
+        _state.update({"connected": True, "url": url, "error": None})
+        log(f"[CHAIN] subscribed via {url} for {len(watched)} contract(s)")
+        async for raw in ws:
+            try:
+                message = json.loads(raw)
+            except ValueError:
+                continue
+            if message.get("id") in requests:
+                if "result" in message:
+                    subs[message["result"]] = requests[message["id"]][0]
+                else:
+                    log(f"[CHAIN] subscribe {requests[message['id']][0]} refused: {message.get('error')}")
+                continue
+            params = message.get("params") or {}
+            kind = subs.get(params.get("subscription"))
+            if kind and isinstance(params.get("result"), dict):
+                try:
+                    _handle(kind, params["result"], watched)
+                except Exception as exc:
+                    log(f"[CHAIN][ERR] {kind}: {exc}")
+
+
+async def _run() -> None:
+    backoff = 1.0
+    while True:
+        url = ws_url()
+        watched = [c for c in (contracts() or []) if isinstance(c, str) and c]
+        started = time.time()
+        try:
+            if not url or not watched:
+                raise RuntimeError("no websocket RPC or no contracts")
+            await _session(url, watched)
+            _state["error"] = "closed by node"
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            _state["error"] = str(exc)
+            log(f"[CHAIN] subscription down: {exc}")
+        finally:
+            _state["connected"] = False
+        if time.time() - started > 60.0:
+            backoff = 1.0
+        await asyncio.sleep(backoff)
+        backoff = min(60.0, backoff * 2)
+
+
+def last_transfer(contract: str) -> Optional[float]:
+    """When a Transfer of ``contract`` was last seen on the subscription (any cause: sale, mint, move)."""
+    return _last_transfer.get(contract.lower())
+
+
+def head() -> Optional[int]:
+    """Latest block number seen on a live subscription, None while it is down."""
+    return _state["head"] if _state["connected"] else None
+
+
+def start() -> None:
+    """Subscribe when a websocket RPC is configured; idempotent."""
+    if not ws_url():
+        return
+    future = _state["future"]
+    if future is not None and not future.done():
+        return
+    _state["future"] = asyncio.run_coroutine_threadsafe(_run(), _loop())
+
+
+def stop() -> None:
+    future = _state["future"]
+    _state["future"] = None
+    if future is not None:
+        future.cancel()
+
+
+def status() -> Dict[str, Any]:
+    return {k: v for k, v in _state.items() if k != "future"}
@@ -25,6 +25,16 @@ class Settings(BaseSettings):
         "\"https://site1.moralis-nodes.com/eth/231746d238334c139d70af0f910d5563\","  # noqa: E501
         "\"https://site2.moralis-nodes.com/eth/231746d238334c139d70af0f910d5563\"]"
     )
+    RPC_TIMEOUT_SEC: float = 6.0  # per-request timeout inside the RPC pool before failing over
+    RPC_PROBE_SEC: float = 15.0  # how often demoted RPC endpoints are re-probed
+    RPC_WS_URL: str = ""  # eth_subscribe endpoint; empty = first ws(s):// URL in RPC_URL/RPC_URLS
+    RPC_NONCE_RESYNC_SEC: float = 30.0  # reconcile the local nonce with the node's pending count
+    RPC_NONCE_DROP_SEC: float = 180.0  # unseen txs older than this count as dropped
+    LOGS_BACKFILL: bool = True  # on start, rebuild the trade window from eth_getLogs across RPC endpoints
+    LOGS_CHUNK_BLOCKS: int = 2000  # initial eth_getLogs block span; halves on "too many results" or a block-range limit
+    LOGS_CHUNK_MAX: int = 10000
+    ENGINE_SCAN_MIN_SEC: float = 1.0  # fastest per-contract rescan (after a signal or a fresh transfer)
+    ENGINE_SCAN_MAX_SEC: float = 60.0  # slowest rescan, for collections with no trades in the window
     BALANCE_SOURCE: str = "auto"  # auto | rpc | moralis
     POSITION_FRACTION: float = 0.25
     POSITION_USD_CEIL: float = 3.0
@@ -42,6 +52,15 @@ class Settings(BaseSettings):
     GAS_MAX_FEE_GWEI: float = 80.0
     GAS_PRIORITY_GWEI: float = 2.0
     GAS_QUANTILE_MAX: float = 0.30
+    OPENSEA_PREFETCH_TTL_SEC: float = 15.0  # prefetched listing/fulfilment data older than this is refetched
+    OPENSEA_LISTINGS_REFRESH_SEC: float = 20.0  # cheapest-page refresh of the listings mirror
+    OPENSEA_LISTINGS_FULL_SEC: float = 600.0  # full re-download of each collection's listings
+    OPENSEA_LISTINGS_MAX_PAGES: int = 5
+    OPENSEA_STREAM: bool = False  # push sales/listings over the OpenSea Stream API websocket
+    OPENSEA_STREAM_URL: str = "wss://stream.openseabeta.com/socket/websocket"
+    GAS_REFRESH_SEC: float = 6.0  # eth_feeHistory poll cadence
+    GAS_HISTORY_BLOCKS: int = 100
+    GAS_UNITS_BUY: int = 150000  # gas of one listing fulfilment, for EV
     CONTRACTS: str = (
         "[\"0x86935F11C86623deC8a25696E1C19a8659CbF95d\","
         "\"0x67F4732266C7300cca593C814d46bee72e40659F\","
@@ -50,6 +69,32 @@ class Settings(BaseSettings):
     )
     MORALIS_RATE_LIMIT_SEC: int = 45
     MORALIS_TRADES_CHAIN: str = "polygon"
+    MORALIS_CU_PER_SEC: float = 5.0  # plan throughput the bucket refills at
+    MORALIS_CU_BURST: float = 150.0
+    MORALIS_CU_RESERVE_PCT: float = 5.0  # below this share of quota only hot contracts are fetched
+    MORALIS_CU_COSTS: str = "{\"balance\":10,\"trades\":20,\"usage\":1}"
+    MORALIS_USAGE_REFRESH_SEC: int = 300  # engine re-reads the plan quota this often; 0 disables
+    MORALIS_CACHE_PATH: str = ""  # SQLite file for warm restarts; empty disables
+    MORALIS_CACHE_BALANCE_TTL_SEC: int = 300
+    MORALIS_CACHE_TRADES_TTL_SEC: int = 86400
+    MORALIS_ENDPOINT_NEG_TTL_SEC: int = 3600
+    MORALIS_CONCURRENCY: int = 8
+    MORALIS_TRADES_PAGE_SIZE: int = 100
+    MORALIS_TRADES_MAX_PAGES: int = 3  # per contract per ingestion round
+    TRADE_STORE_WINDOW_MINUTES: int = 0  # 0 -> WINDOW_MINUTES
+    TRADE_STORE_MAX_PER_CONTRACT: int = 5000
+    MORALIS_HTTP2: bool = True  # used only when the h2 package is installed
+    MORALIS_MAX_CONNECTIONS: int = 10
+    MORALIS_MAX_KEEPALIVE: int = 5
+    MORALIS_KEEPALIVE_SEC: float = 60.0
+    PRICE_REFRESH_SEC: float = 30.0
+    PRICE_COLD_WAIT_SEC: float = 2.0
+    PRICE_SOURCES: str = "coingecko,chainlink"  # comma list; empty = all registered
+    PRICE_ORACLE_FEEDS: str = ""  # JSON {asset: aggregator}; empty = built-in Chainlink feeds for CHAIN
+    PRICE_ORACLE_MAX_AGE_SEC: int = 10800
+    PRICE_HISTORY_SIZE: int = 2880
+    PRICE_EMA_HALF_LIFE_SEC: float = 600.0
+    LOG_BUFFER_SIZE: int = 5000
 
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", case_sensitive=False)
 
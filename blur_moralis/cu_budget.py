@@ -0,0 +1,237 @@
+"""CU-budget-aware admission for Moralis calls (token bucket with priority reserves)."""
+from __future__ import annotations
+
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from .config import settings
+
+PRIORITY_HOT = 0       # trades of contracts with recent activity
+PRIORITY_TRADES = 1    # trades of quiet contracts
+PRIORITY_BALANCE = 2
+PRIORITY_USAGE = 3
+
+# Share of the bucket that must stay untouched after a grant, by priority, so
+# cheap-to-skip calls back off first when tokens are scarce.
+_RESERVE = {PRIORITY_HOT: 0.0, PRIORITY_TRADES: 0.10, PRIORITY_BALANCE: 0.25, PRIORITY_USAGE: 0.50}
+
+_DEFAULT_COSTS = {"balance": 10.0, "trades": 20.0, "usage": 1.0}
+_DEFAULT_PRIORITY = {"balance": PRIORITY_BALANCE, "trades": PRIORITY_TRADES, "usage": PRIORITY_USAGE}
+
+# How far per-key gaps may stretch when the quota runs low.
+_MAX_STRETCH = 10.0
+
+# Families admitted on their per-key gap alone. The usage probe is what
+# refreshes the quota, so neither the bucket nor starvation may lock it out.
+_UNMETERED = ("usage",)
+
+
+def family_of(key: str) -> str:
+    if key.startswith("bal:"):
+        return "balance"
+    if key.startswith("trades:"):
+        return "trades"
+    if key.startswith("usage"):
+        return "usage"
+    return key.split(":", 1)[0]
+
+
+def _costs() -> Dict[str, float]:
+    raw = getattr(settings, "MORALIS_CU_COSTS", "") or ""
+    costs = dict(_DEFAULT_COSTS)
+    try:
+        costs.update({str(k): float(v) for k, v in json.loads(raw).items()})
+    except (TypeError, ValueError, AttributeError):
+        pass
+    return costs
+
+
+def _reset_ts(reset_at: Any) -> Optional[float]:
+    if isinstance(reset_at, (int, float)):
+        ts = float(reset_at)
+        return ts / 1000.0 if ts > 1e11 else ts
+    if isinstance(reset_at, str) and reset_at.strip():
+        txt = reset_at.strip()
+        try:
+            return datetime.fromisoformat(txt[:-1] + "+00:00" if txt.endswith("Z") else txt).timestamp()
+        except ValueError:
+            return None
+    return None
+
+
+def _utc_midnight(now: float) -> float:
+    return datetime.fromtimestamp(now, tz=timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+
+
+def _seconds_to_reset(reset_at: Any, now: float) -> float:
+    """Seconds until the quota period resets; defaults to the next UTC midnight."""
+    ts = _reset_ts(reset_at)
+    if ts is None or ts <= now:
+        ts = _utc_midnight(now) + timedelta(days=1).total_seconds()
+    return max(60.0, ts - now)
+
+
+class CuScheduler:
+    """
+    Token bucket denominated in compute units. Each call costs its endpoint's
+    CU price; refill slows toward ``remaining / time_to_reset`` as the plan
+    quota drains, and per-key gaps stretch by the same factor.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens: Optional[float] = None
+        self._stamp = time.time()
+        self._last: Dict[str, float] = {}
+        self._quota: Dict[str, Any] = {}
+        self._cooldown_until = 0.0
+        self.granted = 0
+        self.denied = 0
+
+    @staticmethod
+    def _base_rate() -> float:
+        return max(0.01, float(getattr(settings, "MORALIS_CU_PER_SEC", 5.0) or 5.0))
+
+    @staticmethod
+    def _capacity() -> float:
+        return max(1.0, float(getattr(settings, "MORALIS_CU_BURST", 150.0) or 150.0))
+
+    def _live_quota(self, now: float) -> Dict[str, Any]:
+        """The last quota read, or {} once its period has reset (the figures are stale)."""
+        quota = self._quota
+        if not quota:
+            return quota
+        reset = _reset_ts(quota.get("reset_at"))
+        if reset is not None:
+            return {} if reset <= now else quota
+        fetched = quota.get("fetched_at")
+        if isinstance(fetched, (int, float)) and fetched < _utc_midnight(now):
+            return {}
+        return quota
+
+    def _budget_rate(self, now: float) -> Optional[float]:
+        quota = self._live_quota(now)
+        remaining = quota.get("remaining")
+        if remaining is None:
+            return None
+        return max(0.0, float(remaining)) / _seconds_to_reset(quota.get("reset_at"), now)
+
+    def _rate(self, now: float) -> float:
+        base = self._base_rate()
+        budget = self._budget_rate(now)
+        return base if budget is None else min(base, 0.9 * budget)
+
+    def _refill(self, now: float) -> None:
+        capacity = self._capacity()
+        if self._tokens is None:
+            self._tokens = capacity
+        self._tokens = min(capacity, self._tokens + (now - self._stamp) * self._rate(now))
+        self._stamp = now
+
+    def stretch(self, now: Optional[float] = None) -> float:
+        """Factor (>= 1) by which per-key gaps are lengthened under quota pressure."""
+        now = now or time.time()
+        rate = self._rate(now)
+        return min(_MAX_STRETCH, max(1.0, self._base_rate() / rate)) if rate > 0 else _MAX_STRETCH
+
+    def _starved(self, now: float) -> bool:
+        quota = self._live_quota(now)
+        remaining, limit = quota.get("remaining"), quota.get("limit")
+        if remaining is None:
+            return False
+        if not limit:
+            return float(remaining) <= 0
+        reserve = float(getattr(settings, "MORALIS_CU_RESERVE_PCT", 5.0) or 0.0) / 100.0
+        return float(remaining) <= float(limit) * reserve
+
+    def acquire(
+        self,
+        key: str,
+        *,
+        gap: Optional[float] = None,
+        family: Optional[str] = None,
+        priority: Optional[int] = None,
+    ) -> bool:
+        """Grant one call for ``key`` if its gap has elapsed and the bucket can pay."""
+        now = time.time()
+        family = family or family_of(key)
+        if priority is None:
+            priority = _DEFAULT_PRIORITY.get(family, PRIORITY_TRADES)
+        cost = _costs().get(family, 10.0)
+        base_gap = gap if gap is not None else max(5, int(getattr(settings, "MORALIS_RATE_LIMIT_SEC", 60)))
+        with self._lock:
+            self._refill(now)
+            if now - self._last.get(key, 0.0) < base_gap * self.stretch(now):
+                return False
+            if family in _UNMETERED:
+                self.granted += 1
+            elif not self._pay(now, cost, priority):
+                return False
+            self._last[key] = now
+            return True
+
+    def charge(self, key: str, *, family: Optional[str] = None, priority: Optional[int] = None) -> bool:
+        """
+        Pay for a follow-up call under an admission ``key`` already holds (the
+        next page of the same sync); no per-key gap, same bucket and reserves.
+        """
+        now = time.time()
+        family = family or family_of(key)
+        if priority is None:
+            priority = _DEFAULT_PRIORITY.get(family, PRIORITY_TRADES)
+        with self._lock:
+            self._refill(now)
+            return self._pay(now, _costs().get(family, 10.0), priority)
+
+    def _pay(self, now: float, cost: float, priority: int) -> bool:
+        if now < self._cooldown_until or (self._starved(now) and priority > PRIORITY_HOT):
+            self.denied += 1
+            return False
+        floor = cost + _RESERVE.get(priority, 0.5) * self._capacity()
+        if self._tokens < floor and not (priority == PRIORITY_HOT and self._tokens >= cost):
+            self.denied += 1
+            return False
+        self._tokens -= cost
+        self.granted += 1
+        return True
+
+    def restore(self, stamps: Dict[str, float]) -> None:
+        with self._lock:
+            for key, ts in stamps.items():
+                self._last[key] = max(ts, self._last.get(key, 0.0))
+
+    def update_quota(self, payload: Optional[Dict[str, Any]]) -> None:
+        """Feed the normalized payload of moralis_api.current_cu_usage."""
+        if not payload:
+            return
+        with self._lock:
+            self._refill(time.time())
+            self._quota = {k: payload.get(k) for k in ("current", "limit", "remaining", "reset_at", "fetched_at")}
+
+    def throttled(self, retry_after: Optional[float] = None) -> None:
+        """Upstream answered 429: empty the bucket and pause for ``retry_after``."""
+        with self._lock:
+            self._tokens = 0.0
+            self._stamp = time.time()
+            self._cooldown_until = max(self._cooldown_until, self._stamp + max(5.0, retry_after or 30.0))
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            self._refill(now)
+            return {
+                "tokens": round(self._tokens or 0.0, 2),
+                "capacity": self._capacity(),
+                "rate_cu_per_sec": round(self._rate(now), 4),
+                "stretch": round(self.stretch(now), 2),
+                "cooldown_sec": round(max(0.0, self._cooldown_until - now), 1),
+                "quota": dict(self._quota),
+                "granted": self.granted,
+                "denied": self.denied,
+            }
+
+
+scheduler = CuScheduler()
@@ -1,11 +1,11 @@
-from fastapi import FastAPI, Body
-from fastapi.responses import HTMLResponse, JSONResponse, FileResponse
+from typing import Optional
+from fastapi import FastAPI, Body, Request
+from fastapi.responses import HTMLResponse, JSONResponse, FileResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from ..runtime import log, get_logs
+from ..runtime import log, logs_page, set_log_capacity
 from ..config import (
     settings,
     contracts,
-    rpc_urls,
     available_strategies,
     normalize_strategy,
     strategy_state,
@@ -13,14 +13,33 @@ from ..config import (
 )
 from ..executor import Web3Helper, LiveNotConfigured
 from ..engine import Engine
-from ..moralis_api import native_balance, ping as moralis_ping, current_cu_usage
-from ..pricing import price_usd
-from .. import paper_wallet
-import os, json, time
+from ..moralis_api import (
+    native_balance,
+    ping as moralis_ping,
+    current_cu_usage,
+    endpoint_stats as moralis_endpoint_stats,
+    close_client as close_moralis_client,
+)
+from ..pricing import price_usd, quote as price_quote, stop_feed as stop_price_feed
+from .. import chain_events, paper_wallet, moralis_async, moralis_cache, opensea_async, opensea_stream, rpc_pool, gas_oracle, listings
+import asyncio, os, json, time
 
 app = FastAPI()
 log("[BOOT] dashboard app loaded — Moralis integrated; open /")
 
+@app.on_event("shutdown")
+def _shutdown():
+    close_moralis_client()
+    opensea_stream.stop()
+    chain_events.stop()
+    opensea_async.close()
+    moralis_async.close()
+    moralis_cache.close()
+    stop_price_feed()
+    gas_oracle.stop_feed()
+    listings.stop_feed()
+    rpc_pool.close()
+
 static_dir = os.path.join(os.path.dirname(__file__), "static")
 app.mount("/static", StaticFiles(directory=static_dir), name="static")
 
@@ -38,16 +57,15 @@ def api_ping():
 
 @app.get("/api/test")
 def api_test():
-    urls=[settings.RPC_URL]+(rpc_urls() or [])
+    pool=rpc_pool.pool()
     ok=False; cid=None
-    for u in [x for x in urls if x]:
-        try:
-            h=Web3Helper(u)
-            if h.is_ok(): ok=True; cid=h.w3.eth.chain_id; break
-        except: pass
+    try:
+        h=Web3Helper.from_pool(pool)
+        if h.is_ok(): ok=True; cid=h.chain_id()
+    except: pass
     mp=moralis_ping()
     log(f"[TEST] rpc_ok={ok} chain={settings.CHAIN} mode={settings.MODE} addr={settings.ADDRESS[:8]}… key(OS)={'yes' if settings.OPENSEA_API_KEY else 'no'} moralis={'ok' if mp else 'fail/limited'}")
-    return {"ok":True, "rpc":{"connected":ok,"chain_id":cid}, "moralis": mp}
+    return {"ok":True, "rpc":{"connected":ok,"chain_id":cid,"best":pool.best_url(),"endpoints":pool.snapshot(),"gas":gas_oracle.snapshot(),"subscription":chain_events.status()}, "moralis": mp}
 
 @app.post("/api/rpc_check")
 def api_rpc_check(body: dict = Body(...)):
@@ -56,7 +74,7 @@ def api_rpc_check(body: dict = Body(...)):
     ok=h.is_ok()
     info={}
     if ok:
-        try: info["chain_id"]=h.w3.eth.chain_id; info["latest_block"]=h.w3.eth.block_number
+        try: info["chain_id"]=h.chain_id(); info["latest_block"]=h.w3.eth.block_number
         except: pass
     log(f"[RPC] {url} -> ok={ok} {info}"); return {"connected": ok, **info, "rpc_url": url}
 
@@ -64,13 +82,9 @@ def api_rpc_check(body: dict = Body(...)):
 def api_wallet():
     eth=0.0; src="rpc"; used=None
     if settings.BALANCE_SOURCE in ("rpc","auto"):
-        urls=[settings.RPC_URL]+(rpc_urls() or [])
-        bwei=0
-        for u in [x for x in urls if x]:
-            try:
-                h=Web3Helper(u)
-                if h.is_ok(): bwei=h.balance(settings.ADDRESS); used=u; break
-            except: pass
+        pool=rpc_pool.pool()
+        bwei=Web3Helper.from_pool(pool).balance(settings.ADDRESS)
+        used=pool.best_url()
         eth = bwei/1e18 if bwei else 0.0
         if settings.BALANCE_SOURCE=="auto" and eth==0.0:
             bwei_m = native_balance(settings.ADDRESS) or 0
@@ -99,6 +113,7 @@ def api_wallet():
         "address": settings.ADDRESS,
         "rpc": used,
         "source": src,
+        "price": price_quote(settings.CHAIN),
         "collection": [],
         "collection_count": 0,
     }
@@ -198,6 +213,7 @@ def api_preset_lowcap_polygon():
         "CONTRACTS": '["0x86935F11C86623deC8a25696E1C19a8659CbF95d","0x67F4732266C7300cca593C814d46bee72e40659F","0xE28D2D8746D855251BA677a91626009CB33aA4F9","0x670fd103b1a08628e9557cD66B87DeD841115190"]'
     }
     for k,v in pairs.items(): setattr(settings, k, v)
+    rpc_pool.evict_stale()
     _save_env(pairs); log("[PRESET] Low‑Cap Polygon applied"); return {"ok":True, "applied":pairs}
 
 @app.post("/api/patch")
@@ -209,6 +225,12 @@ def api_patch(body: dict = Body(...)):
         pairs["RPC_URL"]=body["RPC_URL"]; settings.RPC_URL=pairs["RPC_URL"]
     if "RPC_URLS" in (body or {}):
         pairs["RPC_URLS"]=json.dumps(body["RPC_URLS"]); settings.RPC_URLS=pairs["RPC_URLS"]
+    if "RPC_URL" in (body or {}) or "RPC_URLS" in (body or {}):
+        rpc_pool.evict_stale()
+    if "LOG_BUFFER_SIZE" in (body or {}):
+        size=max(1, int(body["LOG_BUFFER_SIZE"]))
+        pairs["LOG_BUFFER_SIZE"]=str(size); settings.LOG_BUFFER_SIZE=size
+        set_log_capacity(size)
     if pairs: _save_env(pairs); log(f"[PATCH] {list(pairs.keys())}")
     return {"ok":True, "applied": pairs}
 
@@ -221,7 +243,64 @@ def api_leader():
     from ..stats import leaderboard; return {"ok":True, "leader": leaderboard()}
 
 @app.get("/api/logs")
-def api_logs(since:int=0): return {"ok":True, "logs": get_logs(since)}
+def api_logs(since:int=0, limit:int=1000):
+    return {"ok":True, **logs_page(since, max(1, min(limit, 5000)))}
+
+_STREAM_POLL_SEC = 0.25
+_STREAM_PING_SEC = 15.0
+_STREAM_BATCH = 500
+
+def _sse(event: str, data, event_id: Optional[int] = None) -> str:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def _trade_snapshot():
+    from ..stats import kpi, leaderboard
+    return {"status": Engine().status(), "kpi": kpi(), "leader": leaderboard()}
+
+@app.get("/api/stream")
+async def api_stream(request: Request, since: Optional[int] = None):
+    """Server-Sent Events: `log` per new line, `trade` on every register_trade_event.
+
+    Resumes from the later of `since` and the browser's Last-Event-ID (log ids
+    are the event ids); EventSource reconnects with the original `since`.
+    """
+    from ..stats import event_seq
+    try: last_event_id = int(request.headers.get("last-event-id") or 0)
+    except ValueError: last_event_id = 0
+    cursor = max(since or 0, last_event_id)
+
+    async def events():
+        nonlocal cursor
+        seen_seq = None
+        last_sent = time.time()
+        yield "retry: 2000\n\n"
+        while not await request.is_disconnected():
+            page = logs_page(cursor, _STREAM_BATCH)
+            if page["dropped"]:
+                yield _sse("dropped", {"count": page["dropped"]})
+            for entry in page["logs"]:
+                yield _sse("log", entry, entry["id"])
+            cursor = page["next"]
+            seq = event_seq()
+            if seq != seen_seq:
+                seen_seq = seq
+                yield _sse("trade", _trade_snapshot())
+                last_sent = time.time()
+            if page["logs"]:
+                last_sent = time.time()
+                if page["more"]:
+                    continue
+            if time.time() - last_sent >= _STREAM_PING_SEC:
+                yield ": ping\n\n"
+                last_sent = time.time()
+            await asyncio.sleep(_STREAM_POLL_SEC)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.get("/api/moralis_usage")
 def api_moralis_usage(force: bool = False):
@@ -230,7 +309,12 @@ def api_moralis_usage(force: bool = False):
     except Exception as e:
         log(f"[MORALIS][ERR] usage endpoint: {e}")
         return JSONResponse({"ok": False, "error": str(e)}, status_code=500)
-    return {"ok": usage is not None, "usage": usage}
+    from ..cu_budget import scheduler
+    return {"ok": usage is not None, "usage": usage, "endpoints": moralis_endpoint_stats(), "budget": scheduler.snapshot()}
+
+@app.get("/api/listings")
+def api_listings():
+    return {"ok":True, "books": listings.snapshot(), "stream": opensea_stream.status()}
 
 @app.get("/api/settings")
 def api_settings():
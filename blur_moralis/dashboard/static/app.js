@@ -14,6 +14,7 @@ let engineStatusTimer=null;
 let logTimer=null;
 let usageTimer=null;
 let logCursor=0;
+let eventStream=null;
 let lastUsageHash=null;
 let lastUsageLogTs=0;
 let strategyStatus=null;
@@ -566,10 +567,12 @@ async function fetchLogs(){
   try{
     const response=await jget(`/api/logs?since=${logCursor}`);
     const logs=response?.logs||[];
+    if(response?.dropped>0) ap(`[logs] пропущено ${response.dropped} строк (буфер переполнен)`);
     logs.forEach(entry=>{
       if(entry?.id!=null) logCursor=Math.max(logCursor, Number(entry.id));
       if(entry?.line) ap(entry.line);
     });
+    if(response?.next!=null) logCursor=Number(response.next);
   }catch(err){
     ap('[logs] '+(err?.message||err));
   }
@@ -581,6 +584,42 @@ function startLogPolling(){
   logTimer=setInterval(fetchLogs, LOG_INTERVAL);
 }
 
+function stopPolling(){
+  if(logTimer){ clearInterval(logTimer); logTimer=null; }
+  if(engineStatusTimer){ clearInterval(engineStatusTimer); engineStatusTimer=null; }
+}
+
+function startStream(){
+  if(!window.EventSource) return false;
+  if(eventStream) eventStream.close();
+  const source=new EventSource(`/api/stream?since=${logCursor}`);
+  eventStream=source;
+  source.onopen=()=>stopPolling();
+  source.addEventListener('log',ev=>{
+    let entry=null;
+    try{ entry=JSON.parse(ev.data); }catch{ return; }
+    if(entry?.id!=null) logCursor=Math.max(logCursor, Number(entry.id));
+    if(entry?.line) ap(entry.line);
+  });
+  source.addEventListener('dropped',ev=>{
+    try{ ap(`[logs] пропущено ${JSON.parse(ev.data).count} строк (буфер переполнен)`); }catch{}
+  });
+  source.addEventListener('trade',ev=>{
+    let data=null;
+    try{ data=JSON.parse(ev.data); }catch{ return; }
+    if(data?.status) setEngineStatusUI(data.status);
+    if(data?.kpi) kpi(data.kpi);
+    if(data?.leader) leader(data.leader);
+  });
+  source.onerror=()=>{
+    // EventSource reconnects by itself with Last-Event-ID; poll meanwhile.
+    if(source.readyState===EventSource.CLOSED) eventStream=null;
+    if(!logTimer) startLogPolling();
+    if(!engineStatusTimer) startEngineStatusPolling();
+  };
+  return true;
+}
+
 async function moralisUsage(){
   try{
     const response=await jget('/api/moralis_usage');
@@ -658,11 +697,11 @@ async function wallet(){ const w=await jget('/api/wallet');
   }
 }
 
-async function kpi(){ const j=await jget('/api/kpi'); const m=j.kpi||{};
+async function kpi(data){ const m=data||(await jget('/api/kpi')).kpi||{};
   function upd(key, barId, wrId){ const v=m[key]||{winrate:0}; e(wrId).textContent=(v.winrate||0)+'%'; e(barId).style.width=(v.winrate||0)+'%'}
   upd('undercut','bar_u','wr_u'); upd('mean_revert','bar_mr','wr_mr'); upd('momentum','bar_m','wr_m'); upd('hybrid','bar_h','wr_h')
 }
-async function leader(){ const j=await jget('/api/leader'); const L=j.leader||{};
+async function leader(data){ const L=data||(await jget('/api/leader')).leader||{};
   e('nl').textContent=L.nl||e('nl').textContent; e('best').textContent=L.best||'—'
 }
 
@@ -816,11 +855,18 @@ async function boot(){
   await leader();
   await riskStats();
   await engineStatus();
-  startEngineStatusPolling();
-  startLogPolling();
+  if(!startStream()){
+    startEngineStatusPolling();
+    startLogPolling();
+  }
   startUsagePolling();
 }
-async function refresh(){ await wallet(); await kpi(); await leader(); await riskStats(); await loadStrategy() }
+async function refresh(){
+  const streaming=eventStream&&eventStream.readyState===EventSource.OPEN;
+  await wallet();
+  if(!streaming){ await kpi(); await leader(); }
+  await riskStats(); await loadStrategy()
+}
 setupLogTabs();
 setupLogScrollHandling();
 boot(); setInterval(refresh, REFRESH_INTERVAL)
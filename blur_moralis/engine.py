@@ -1,22 +1,30 @@
 import threading, time, random
-from datetime import datetime
 from typing import Optional, Tuple
 from .runtime import log
 from .config import (
     settings,
     contracts,
-    rpc_urls,
     available_strategies,
     normalize_strategy,
     strategy_state,
     native_symbol,
 )
-from .executor import Web3Helper, make_executor, PaperExecutor, LiveNotConfigured
+from .executor import Web3Helper, make_executor, PaperExecutor, LiveNotConfigured, read_balances
 from .pricing import price_usd
-from .moralis_api import recent_trades
+from .trade_store import window_trades
 from .stats import stats, risk, register_trade_event
-from web3 import Web3
-from . import paper_wallet
+from . import (
+    chain_events,
+    gas_oracle,
+    listings,
+    log_backfill,
+    moralis_api,
+    opensea_stream,
+    paper_wallet,
+    rpc_pool,
+    scan_scheduler,
+    trade_store,
+)
 
 class Engine:
     _inst=None
@@ -30,6 +38,7 @@ class Engine:
         self._thread=None
         self._w3=None
         self._ex=None
+        self._balance_block=None
         self._stop_reason=None
         self._started_at=None
         self._stopped_at=None
@@ -37,6 +46,7 @@ class Engine:
         self._warned_bad_strategy=False
         self._warned_no_strategy=False
         self._last_strategy_announce=None
+        self._scheduler=scan_scheduler.scheduler
 
     @staticmethod
     def _to_float(value, default: float = 0.0) -> float:
@@ -84,9 +94,15 @@ class Engine:
         risk["last_trade_profit_usd"]=0.0
         self._thread=threading.Thread(target=self.run,daemon=True)
         self._thread.start()
+        opensea_stream.start()
+        chain_events.start()
+        log_backfill.start()
         log("[ENGINE] started")
     def stop(self, reason: Optional[str]=None):
         self._stop=True
+        self._scheduler.wake()
+        opensea_stream.stop()
+        chain_events.stop()
         if reason:
             self._stop_reason=reason
             log(f"[ENGINE] stop signal ({reason})")
@@ -136,37 +152,36 @@ class Engine:
             "strategy": strategy_state(),
         }
     def _connect(self):
-        urls=[settings.RPC_URL]+(rpc_urls() or [])
-        last_error=None
-        for u in [x for x in urls if x]:
-            try:
-                h=Web3Helper(u)
-                if h.is_ok():
-                    self._w3=h.w3
-                    log(f"[RPC] {u} chainId={self._w3.eth.chain_id} CHAIN={settings.CHAIN}")
-                    self._ex=make_executor(self._w3, settings.ADDRESS, settings.PRIVATE_KEY)
-                    register_trade_event("waiting", contract="", note="RPC подключен, ожидаем сигналы", action="connect")
-                    return True
-            except LiveNotConfigured as e:
-                log(f"[LIVE][ERR] {e}")
-                self._stop_reason=str(e)
-                raise
-            except Exception as e:
-                last_error=e
-                log(f"[RPC] fail {u} {e}")
-        if last_error:
-            self._stop_reason=f"RPC connect failed: {last_error}"
-        elif not urls or not any(urls):
+        pool=rpc_pool.pool()
+        if not pool.urls():
             self._stop_reason="RPC connect failed: no RPC URLs configured"
-        return False
+            return False
+        try:
+            h=Web3Helper.from_pool(pool)
+            if not h.is_ok():
+                self._stop_reason=f"RPC connect failed: no healthy endpoint among {len(pool.urls())}"
+                return False
+            self._w3=h.w3
+            log(f"[RPC] pool best={pool.best_url()} chainId={h.chain_id()} CHAIN={settings.CHAIN}")
+            self._ex=make_executor(self._w3, settings.ADDRESS, settings.PRIVATE_KEY)
+            register_trade_event("waiting", contract="", note="RPC подключен, ожидаем сигналы", action="connect")
+            return True
+        except LiveNotConfigured as e:
+            log(f"[LIVE][ERR] {e}")
+            self._stop_reason=str(e)
+            raise
+        except Exception as e:
+            log(f"[RPC] pool connect failed: {e}")
+            self._stop_reason=f"RPC connect failed: {e}"
+            return False
     def _native_balance(self) -> float:
         if not self._w3 or not settings.ADDRESS:
             return 0.0
         try:
-            bal = self._w3.eth.get_balance(Web3.to_checksum_address(settings.ADDRESS)) / 1e18
+            self._balance_block, balances = read_balances(self._w3, [settings.ADDRESS])
         except Exception:
             return 0.0
-        return self._to_float(bal, 0.0)
+        return self._to_float(next(iter(balances.values())) / 1e18, 0.0)
     def _check_auto_stop(self, trade_profit: Optional[float]=None):
         if self._stop: return
         threshold=self._to_float(getattr(settings,"AUTO_STOP_PROFIT_USD",0.0) or 0.0, 0.0)
@@ -215,136 +230,7 @@ class Engine:
         elif mode=="auto":
             log("[СТРАТЕГИЯ] автоматический выбор — набор стратегий переключается автоматически")
 
-    def _coerce_timestamp(self, value) -> Optional[float]:
-        if value is None:
-            return None
-        if isinstance(value, (int, float)):
-            ts=float(value)
-            while ts>1e12:
-                ts/=1000.0
-            if ts>1e10:
-                ts/=1000.0
-            return ts
-        if isinstance(value, str):
-            txt=value.strip()
-            if not txt:
-                return None
-            try:
-                return self._coerce_timestamp(float(txt))
-            except (TypeError, ValueError):
-                pass
-            try:
-                if txt.endswith("Z"):
-                    txt = txt[:-1] + "+00:00"
-                return datetime.fromisoformat(txt).timestamp()
-            except ValueError:
-                return None
-        return None
-
-    def _parse_trade_timestamp(self, trade: dict) -> Optional[float]:
-        for key in (
-            "block_timestamp",
-            "blockTimestamp",
-            "timestamp",
-            "ts",
-            "time",
-            "created_at",
-            "createdAt",
-            "event_timestamp",
-        ):
-            if key in trade:
-                ts=self._coerce_timestamp(trade.get(key))
-                if ts is not None:
-                    return ts
-        return None
-
-    def _as_positive_float(self, value) -> Optional[float]:
-        if value is None:
-            return None
-        try:
-            num=float(value)
-        except (TypeError, ValueError):
-            return None
-        if num<0:
-            return None
-        return num
-
-    def _parse_trade_usd(self, trade: dict) -> Optional[float]:
-        for key in (
-            "price_usd",
-            "usd_price",
-            "usdPrice",
-            "priceUsd",
-            "sale_price_usd",
-            "total_price_usd",
-            "value_usd",
-            "valueUsd",
-        ):
-            if key in trade:
-                usd=self._as_positive_float(trade.get(key))
-                if usd is not None:
-                    return usd
-        native=trade.get("native_price") or trade.get("nativePrice")
-        if isinstance(native, dict):
-            if "usd" in native or "usd_price" in native or "usdPrice" in native:
-                usd=self._as_positive_float(native.get("usd") or native.get("usd_price") or native.get("usdPrice"))
-                if usd is not None:
-                    return usd
-            native_value=native.get("value") or native.get("amount")
-            decimals=native.get("decimals")
-            maybe=self._as_positive_float(native_value)
-            if maybe is not None and decimals is not None:
-                try:
-                    scale=10 ** int(decimals)
-                    if scale>0:
-                        return maybe/scale
-                except (TypeError, ValueError):
-                    pass
-        token=trade.get("payment_token") or trade.get("paymentToken")
-        if isinstance(token, dict):
-            usd_price=self._as_positive_float(token.get("usd_price") or token.get("usdPrice"))
-            amount=self._as_positive_float(trade.get("total_price") or trade.get("price"))
-            decimals=token.get("decimals")
-            if amount is not None and usd_price is not None:
-                try:
-                    if decimals is not None:
-                        scale=10 ** int(decimals)
-                        if scale>0:
-                            amount/=scale
-                except (TypeError, ValueError):
-                    pass
-                return amount*usd_price
-        fallback=self._as_positive_float(trade.get("price") or trade.get("total_price"))
-        return fallback
-
-    def _extract_buyer(self, trade: dict) -> Optional[str]:
-        for key in (
-            "buyer_address",
-            "buyerAddress",
-            "buyer",
-            "to_address",
-            "toAddress",
-            "to",
-            "winner_address",
-            "winnerAddress",
-        ):
-            if key in trade:
-                value=trade.get(key)
-                if isinstance(value, str):
-                    candidate=value.strip()
-                    if candidate:
-                        return candidate
-        buyer=trade.get("buyer") or trade.get("to_account") or trade.get("toAccount")
-        if isinstance(buyer, dict):
-            for field in ("address", "wallet_address", "walletAddress"):
-                value=buyer.get(field)
-                if isinstance(value, str):
-                    candidate=value.strip()
-                    if candidate:
-                        return candidate
-        return None
-
-    def _evaluate_liquidity(self, trades) -> Tuple[bool, str]:
+    def _evaluate_liquidity(self, contract) -> Tuple[bool, str]:
         window_minutes=int(getattr(settings, "WINDOW_MINUTES", 0) or 0)
         min_trades=int(getattr(settings, "MIN_TRADES_IN_WINDOW", 0) or 0)
         min_buyers=int(getattr(settings, "MIN_UNIQUE_BUYERS", 0) or 0)
@@ -353,37 +239,49 @@ class Engine:
             return True, "требования к ликвидности отключены"
         if window_minutes<=0:
             window_minutes=60
-        dataset=trades or []
-        if not dataset:
+        st=trade_store.store(contract) if isinstance(contract, str) and contract else None
+        if st is None or not len(st):
             if min_trades or min_buyers or min_volume:
                 return False, "нет данных по последним сделкам"
             return True, "требования к ликвидности отключены"
-        since=time.time() - float(window_minutes)*60.0
-        count=0
-        buyers=set()
-        volume=0.0
-        for trade in dataset:
-            if not isinstance(trade, dict):
-                continue
-            ts=self._parse_trade_timestamp(trade)
-            if ts is None or ts<since:
-                continue
-            count+=1
-            buyer=self._extract_buyer(trade)
-            if buyer:
-                buyers.add(buyer.lower())
-            usd=self._parse_trade_usd(trade)
-            if usd is not None:
-                volume+=max(0.0, usd)
+        count, buyers, volume = st.window_stats(float(window_minutes)*60.0)
         if min_trades and count<min_trades:
             return False, f"недостаточно сделок: {count}/{min_trades} за {window_minutes} мин"
-        if min_buyers and len(buyers)<min_buyers:
-            return False, f"мало покупателей: {len(buyers)}/{min_buyers} за {window_minutes} мин"
+        if min_buyers and buyers<min_buyers:
+            return False, f"мало покупателей: {buyers}/{min_buyers} за {window_minutes} мин"
         if min_volume and volume<min_volume:
             return False, f"объём ${volume:.2f} < {min_volume:.2f} за {window_minutes} мин"
         if count==0 and (min_trades or min_buyers or min_volume):
             return False, "сделки за окно не найдены"
-        return True, f"ликвидность ok: {count} сделок, {len(buyers)} покупателей, объём ${volume:.2f}"
+        return True, f"ликвидность ok: {count} сделок, {buyers} покупателей, объём ${volume:.2f}"
+
+    def _scan_contract(self, c) -> Optional[dict]:
+        """Scan stage for one contract: signal check, book lookup, liquidity (local state only)."""
+        if isinstance(c, str):
+            short_c=(c[:8]+"…") if len(c)>8 else c
+        else:
+            short_c=str(c) if c else "—"
+        if self._stop:
+            return None
+        register_trade_event("scanning", contract=c, note=f"Проверяем {short_c}", action="scan")
+        log(f"[ENGINE][SCAN] {short_c} — проверка сигнала")
+        log(f"[STATUS][RUNNING][SCAN] Просмотр предложения по {short_c}")
+        trigger=random.random()
+        if trigger>=0.05:
+            log(f"[ENGINE][WAIT] {short_c} — сигнала нет")
+            register_trade_event("waiting", contract=c, note=f"Сигналов нет по {short_c}", action="wait")
+            log(f"[STATUS][RUNNING][SCAN] {short_c} — сигналов нет, двигаемся дальше")
+            return None
+        listing=listings.cheapest(c) if settings.OPENSEA_API_KEY else None
+        token_id=listing.token_id if listing else "1"
+        if listing:
+            log(f"[ENGINE][BOOK] {short_c} — cheapest token {token_id} at {listing.price:.6f} {native_symbol(settings.CHAIN)}")
+        return {
+            "contract": c,
+            "short": short_c,
+            "token_id": token_id,
+            "liquidity": self._evaluate_liquidity(c),
+        }
 
     def run(self):
         try:
@@ -400,41 +298,45 @@ class Engine:
         log("[ENGINE] loop enter")
         self._last_heartbeat=time.time()
         register_trade_event("waiting", note="Цикл запущен, ожидаем сигналы", action="loop")
+        self._scheduler.reset()
         try:
             while not self._stop:
+                self._scheduler.sync(contracts() or [])
+                due=self._scheduler.pop_due()
+                if not due:
+                    self._last_heartbeat=time.time()
+                    self._scheduler.wait(max_wait=5.0)
+                    continue
                 px=self._to_float(price_usd(settings.CHAIN) or 0.0, 0.0)
                 symbol=native_symbol(settings.CHAIN)
                 native_balance = self._to_float(self._native_balance(), 0.0)
                 if settings.MODE == "paper":
                     paper_wallet.bootstrap(native_balance, price=px, symbol=symbol)
                 self._last_heartbeat=time.time()
-                for c in contracts() or []:
-                    if isinstance(c, str):
-                        short_c=(c[:8]+"…") if len(c)>8 else c
-                    else:
-                        short_c=str(c) if c else "—"
-                    register_trade_event("scanning", contract=c, note=f"Проверяем {short_c}", action="scan")
-                    log(f"[ENGINE][SCAN] {short_c} — проверка сигнала")
-                    log(f"[STATUS][RUNNING][SCAN] Просмотр предложения по {short_c}")
-                    trigger=random.random()
-                    if trigger>=0.05:
-                        log(f"[ENGINE][WAIT] {short_c} — сигнала нет")
-                        register_trade_event("waiting", contract=c, note=f"Сигналов нет по {short_c}", action="wait")
-                        log(f"[STATUS][RUNNING][SCAN] {short_c} — сигналов нет, двигаемся дальше")
-                        time.sleep(0.1)
+                moralis_api.refresh_usage()
+                trades_by_contract=window_trades(due)
+                outcomes={c: scan_scheduler.IDLE for c in due}
+                # the network fan-out is window_trades (sync_many, bounded by MORALIS_CONCURRENCY);
+                # scanning reads local state and decide/execute stays serial so spend and size limits hold
+                for scan in map(self._scan_contract, due):
+                    if scan is None:
                         continue
+                    if self._stop:
+                        return
+                    c=scan["contract"]
+                    short_c=scan["short"]
+                    outcomes[c]=scan_scheduler.SKIP
                     strategy, strategy_mode = self._select_strategy()
                     if not strategy:
                         log(f"[СТРАТЕГИЯ][СКИП] {short_c} — нет доступных стратегий, ждём обновления настроек")
                         register_trade_event("skipped", contract=c, strategy=None,
                                               note="Нет активных стратегий", action="skip")
-                        time.sleep(0.1)
                         continue
                     self._announce_strategy(strategy_mode, strategy)
                     register_trade_event("signal", contract=c, strategy=strategy, note=f"Сигнал {strategy} обнаружен", action="signal")
+                    token_id=scan["token_id"]
                     log(f"[STATUS][RUNNING][SIGNAL] {short_c} — стратегия {strategy}")
-                    trades = recent_trades(c, limit=25)
-                    liquidity_ok, liquidity_note = self._evaluate_liquidity(trades)
+                    liquidity_ok, liquidity_note = scan["liquidity"]
                     if not liquidity_ok:
                         log(f"[РЕШЕНИЕ][SKIP] {short_c} — {liquidity_note}. Пропускаем сигнал")
                         register_trade_event(
@@ -445,16 +347,25 @@ class Engine:
                             action="skip",
                         )
                         log(f"[STATUS][RUNNING][SKIP] {short_c} — {liquidity_note}; двигаемся дальше")
-                        time.sleep(0.1)
                         continue
                     if liquidity_note:
                         log(f"[ENGINE][LIQ] {short_c} — {liquidity_note}")
+                    if settings.MODE in ("live","auto") and hasattr(self._ex,"prefetch"):
+                        # OpenSea answers while EV and sizing are worked out below
+                        try:
+                            self._ex.prefetch(c, token_id)
+                        except Exception as e:
+                            log(f"[LIVE][WARN] prefetch {short_c}: {e}")
                     edge=self._to_float(abs(random.gauss(0.008,0.006)), 0.0)
                     fee=0.025
-                    gas_usd = 0.02 if settings.CHAIN=='polygon' else 1.0
                     gas_quantile=self._to_float(getattr(settings, "GAS_QUANTILE_MAX", 1.0) or 1.0, 1.0)
-                    if 0.0 < gas_quantile < 1.0:
-                        gas_usd*=gas_quantile
+                    gas_native=gas_oracle.buy_cost_native(gas_quantile) if 0.0 < gas_quantile <= 1.0 else None
+                    if gas_native is not None and px:
+                        gas_usd=self._to_float(gas_native*px, 0.0)
+                    else:
+                        gas_usd = 0.02 if settings.CHAIN=='polygon' else 1.0
+                        if 0.0 < gas_quantile < 1.0:
+                            gas_usd*=gas_quantile
                     if settings.MODE == "paper":
                         snapshot = paper_wallet.snapshot(price=px, symbol=symbol)
                         current_native = self._to_float(snapshot.get("balance_native"), native_balance)
@@ -480,7 +391,6 @@ class Engine:
                             action="skip",
                         )
                         log(f"[STATUS][RUNNING][SKIP] {short_c} — {skip_reason}; двигаемся дальше")
-                        time.sleep(0.1)
                         continue
                     if ev<=0 or edge_pct<usd_min:
                         skip_reason=(
@@ -496,7 +406,6 @@ class Engine:
                             action="skip",
                         )
                         log(f"[STATUS][RUNNING][SKIP] {short_c} — {skip_reason}; двигаемся дальше")
-                        time.sleep(0.1)
                         continue
                     fraction=self._to_float(getattr(settings, "POSITION_FRACTION", 0.002) or 0.002, 0.002)
                     usd_ceil=self._to_float(getattr(settings, "POSITION_USD_CEIL", 3.0) or 3.0, 3.0)
@@ -508,8 +417,9 @@ class Engine:
                     size_usd=self._to_float(size_usd,0.0)
                     size_native=self._to_float((size_usd/px) if px else 0.0,0.0)
                     size_amount=self._to_float(size_native if px else size_usd,0.0)
-                    trade={"contract":c,"token_id":"1","strategy":strategy,"edge":edge,"size_usd":size_usd,
+                    trade={"contract":c,"token_id":token_id,"strategy":strategy,"edge":edge,"size_usd":size_usd,
                            "size_native":size_native}
+                    outcomes[c]=scan_scheduler.SIGNAL
                     register_trade_event(
                         "entering",
                         contract=c,
@@ -653,10 +563,13 @@ class Engine:
                             self._check_auto_stop()
                     if self._stop:
                         return
-                    time.sleep(0.2)
-            if self._stop:
-                return
-            time.sleep(1.0)
+                for c in due:
+                    self._scheduler.reschedule(
+                        c,
+                        outcomes[c],
+                        trades_in_window=len(trades_by_contract.get(c) or []),
+                        last_transfer=chain_events.last_transfer(c),
+                    )
         except Exception as e:
             self._stop=True
             if not self._stop_reason:
@@ -1,35 +1,42 @@
-from typing import Optional
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
 
 from web3 import Web3
-from web3.middleware import geth_poa_middleware
 
 from .runtime import log
+from .singleflight import flight
 from .config import settings
+from .rpc_pool import RpcPool, batch, chain_id_for, web3_for
+from . import chain_events
 from .live_exec import OpenSeaExecutor, LiveNotConfigured
 
 class Web3Helper:
-    def __init__(self, rpc_url:str):
+    def __init__(self, rpc_url:str, w3: Optional[Web3]=None):
         self.rpc_url=rpc_url
-        self.w3=self._make_web3(rpc_url)
+        self.w3=w3 if w3 is not None else self._make_web3(rpc_url)
+        self._pool: Optional[RpcPool]=None
+
+    @classmethod
+    def from_pool(cls, pool: RpcPool) -> "Web3Helper":
+        """Helper whose requests are routed through ``pool`` with failover."""
+        helper=cls("pool", pool.web3())
+        helper._pool=pool
+        return helper
 
     def _make_web3(self, rpc_url: Optional[str]) -> Optional[Web3]:
         if not rpc_url:
             return None
         try:
-            if rpc_url.lower().startswith(("ws://", "wss://")):
-                provider = Web3.WebsocketProvider(rpc_url, websocket_kwargs={"max_size": 2 ** 25})
-            else:
-                provider = Web3.HTTPProvider(rpc_url, request_kwargs={"timeout": 20})
-            w3 = Web3(provider)
-            try:
-                w3.middleware_onion.inject(geth_poa_middleware, layer=0)
-            except ValueError:
-                pass
-            return w3
+            return web3_for(rpc_url)
         except Exception as exc:
             log(f"[RPC][ERR] failed to init provider {rpc_url}: {exc}")
             return None
 
+    def chain_id(self)->int:
+        """Chain id, cached per provider."""
+        if self._pool is not None:
+            return self._pool.chain_id()
+        return chain_id_for(self.rpc_url)
+
     def is_ok(self)->bool:
         if not self.w3:
             return False
@@ -47,12 +54,60 @@ class Web3Helper:
     def balance(self, address:str)->int:
         if not self.w3 or not address:
             return 0
+        return flight.do(("rpc:balance", self.rpc_url, address.lower()), lambda: self._balance(address))
+
+    def _balance(self, address:str)->int:
         try:
-            return self.w3.eth.get_balance(Web3.to_checksum_address(address))
+            return next(iter(read_balances(self.w3, [address])[1].values()))
         except Exception as exc:
             log(f"[RPC][ERR] balance fetch failed via {self.rpc_url}: {exc}")
             return 0
 
+class ChainState(NamedTuple):
+    block: int
+    chain_id: int
+    nonce: int  # pending
+
+
+def _int_result(reply: dict) -> int:
+    if "error" in reply or "result" not in reply:
+        raise ValueError(f"RPC error: {reply.get('error')}")
+    value = reply["result"]
+    return int(value, 16) if isinstance(value, str) else int(value)
+
+
+def read_chain_state(w3: Web3, address: str) -> ChainState:
+    """
+    Head block, chain id and pending nonce of ``address`` in one JSON-RPC
+    batch (the pending count is what the nonce manager wants, at no block).
+    Balances go through read_balances, which pins them to one block.
+    """
+    addr = Web3.to_checksum_address(address)
+    replies = batch(w3, [
+        ("eth_blockNumber", []),
+        ("eth_chainId", []),
+        ("eth_getTransactionCount", [addr, "pending"]),
+    ])
+    return ChainState(*(_int_result(r) for r in replies))
+
+
+def read_balances(w3: Web3, addresses: Iterable[str], block: Optional[int] = None) -> Tuple[int, Dict[str, int]]:
+    """
+    Balances of several addresses in one batch, every read pinned to the same
+    ``block``. Without ``block`` the head of the newHeads subscription is used
+    (one round trip); when none runs, or the node has not reached that head,
+    the node's own head is asked first.
+    """
+    addrs = [Web3.to_checksum_address(a) for a in addresses]
+    at = block if block is not None else chain_events.head()
+    if at is not None:
+        replies = batch(w3, [("eth_getBalance", [a, hex(at)]) for a in addrs])
+        if block is not None or not any("error" in r for r in replies):
+            return at, {a: _int_result(r) for a, r in zip(addrs, replies)}
+    head = _int_result(batch(w3, [("eth_blockNumber", [])])[0])
+    return read_balances(w3, addrs, head)
+
+
 class PaperExecutor:
     def buy(self, trade, size_eth: float):
         tx=f"paper-{trade.get('contract')}-{trade.get('token_id')}"
@@ -0,0 +1,178 @@
+"""EIP-1559 fee oracle fed by eth_feeHistory on a background thread."""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config import settings
+from .runtime import log
+
+# Reward percentiles requested per block; quantile queries interpolate nothing
+# and just index the merged, pre-sorted tips.
+_PERCENTILES = [float(p) for p in range(5, 100, 5)]
+
+# Typical fulfilment of one Seaport listing, used when GAS_UNITS_BUY is unset.
+_DEFAULT_BUY_GAS = 150_000
+
+
+class FeeWindow:
+    """
+    Rolling window of recent blocks: base fee and priority-fee percentiles.
+    Every refresh rebuilds the sorted tips once, so ``tip(q)`` is an index lookup.
+    """
+
+    def __init__(self, blocks: int = 100):
+        self._lock = threading.Lock()
+        self._max_blocks = max(1, int(blocks))
+        self._blocks: "OrderedDict[int, Tuple[int, List[int]]]" = OrderedDict()
+        self._tips: List[int] = []
+        self._next_base = 0
+        self._updated = 0.0
+
+    def merge(self, history: Dict[str, Any]) -> int:
+        """Fold one eth_feeHistory reply in; returns the number of new blocks."""
+        oldest = int(history["oldestBlock"])
+        base = [int(x) for x in history["baseFeePerGas"]]
+        rewards = [[int(x) for x in row] for row in (history.get("reward") or [])]
+        added = 0
+        with self._lock:
+            for i, row in enumerate(rewards):
+                number = oldest + i
+                if number not in self._blocks:
+                    added += 1
+                self._blocks[number] = (base[i], row)
+            while len(self._blocks) > self._max_blocks:
+                self._blocks.popitem(last=False)
+            self._blocks = OrderedDict(sorted(self._blocks.items()))
+            # feeHistory returns one extra base fee: the next block's
+            if base:
+                self._next_base = base[-1]
+            self._tips = sorted(tip for _, row in self._blocks.values() for tip in row)
+            self._updated = time.time()
+        return added
+
+    def tip(self, q: float) -> Optional[int]:
+        tips = self._tips
+        if not tips:
+            return None
+        q = min(1.0, max(0.0, float(q)))
+        return tips[int(q * (len(tips) - 1))]
+
+    def next_base(self) -> int:
+        return self._next_base
+
+    def head(self) -> Optional[int]:
+        with self._lock:
+            return next(reversed(self._blocks)) if self._blocks else None
+
+    def age(self) -> Optional[float]:
+        return (time.time() - self._updated) if self._updated else None
+
+    def __len__(self) -> int:
+        return len(self._blocks)
+
+
+_window = FeeWindow(int(getattr(settings, "GAS_HISTORY_BLOCKS", 100) or 100))
+_feed: Dict[str, Any] = {"thread": None, "wake": threading.Event(), "stop": False}
+
+
+def _interval() -> float:
+    return max(1.0, float(getattr(settings, "GAS_REFRESH_SEC", 6.0) or 6.0))
+
+
+def refresh() -> bool:
+    """Pull new blocks' fee history through the RPC pool."""
+    from . import rpc_pool
+
+    pool = rpc_pool.pool()
+    if not pool.urls():
+        return False
+    want = int(getattr(settings, "GAS_HISTORY_BLOCKS", 100) or 100)
+    count = min(want, 1024) if not len(_window) else min(want, 20)
+    history = pool.web3().eth.fee_history(count, "latest", _PERCENTILES)
+    _window.merge(history)
+    return True
+
+
+def _feed_loop() -> None:
+    failures = 0; last_log = 0.0
+    while not _feed["stop"]:
+        try:
+            refresh()
+            failures = 0
+        except Exception as exc:
+            failures += 1
+            now = time.time()
+            if now - last_log >= 300.0:
+                log(f"[GAS] fee history unavailable: {exc}")
+                last_log = now
+        delay = _interval() if not failures else min(300.0, _interval() * (2 ** min(failures, 6)))
+        _feed["wake"].wait(delay)
+        _feed["wake"].clear()
+
+
+def start_feed() -> None:
+    """Start the background fee poller (idempotent)."""
+    thread = _feed["thread"]
+    if thread is not None and thread.is_alive():
+        return
+    _feed["stop"] = False
+    thread = threading.Thread(target=_feed_loop, name="gas-feed", daemon=True)
+    _feed["thread"] = thread
+    thread.start()
+
+
+def stop_feed() -> None:
+    _feed["stop"] = True
+    _feed["wake"].set()
+
+
+def _fresh() -> bool:
+    age = _window.age()
+    return age is not None and age <= max(60.0, 10 * _interval())
+
+
+def fees(q: Optional[float] = None) -> Optional[Tuple[int, int]]:
+    """
+    ``(max_fee_per_gas, max_priority_fee_per_gas)`` in wei for a tip at quantile
+    ``q`` (default GAS_QUANTILE_MAX); max fee leaves room for two base-fee
+    doublings. None until the feed has fresh data.
+    """
+    start_feed()
+    if not _fresh():
+        return None
+    q = float(getattr(settings, "GAS_QUANTILE_MAX", 0.3) or 0.3) if q is None else q
+    tip = _window.tip(q)
+    if tip is None:
+        return None
+    return 2 * _window.next_base() + tip, tip
+
+
+def gas_price(q: Optional[float] = None) -> Optional[int]:
+    """Expected effective price per gas (next base fee + tip) in wei."""
+    quoted = fees(q)
+    if quoted is None:
+        return None
+    return _window.next_base() + quoted[1]
+
+
+def buy_cost_native(q: Optional[float] = None) -> Optional[float]:
+    """Expected native-token cost of one buy at quantile ``q``."""
+    price = gas_price(q)
+    if price is None:
+        return None
+    units = int(getattr(settings, "GAS_UNITS_BUY", _DEFAULT_BUY_GAS) or _DEFAULT_BUY_GAS)
+    return units * price / 1e18
+
+
+def snapshot() -> Dict[str, Any]:
+    age = _window.age()
+    return {
+        "blocks": len(_window),
+        "head": _window.head(),
+        "next_base_gwei": round(_window.next_base() / 1e9, 3),
+        "tip_p50_gwei": round((_window.tip(0.5) or 0) / 1e9, 3),
+        "age_sec": round(age, 1) if age is not None else None,
+    }
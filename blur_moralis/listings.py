@@ -0,0 +1,271 @@
+"""Local mirror of each watched collection's OpenSea listings, indexed by price."""
+from __future__ import annotations
+
+import asyncio
+import bisect
+import heapq
+import threading
+import time
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .config import contracts, settings
+from .runtime import log
+
+
+class Listing(NamedTuple):
+    order_hash: str
+    token_id: str
+    price: float  # native units
+    expires: float  # unix seconds; 0 = no expiry
+    order: Dict[str, Any]
+
+
+def parse_listing(raw: Dict[str, Any]) -> Optional[Listing]:
+    """OpenSea v2 listing -> Listing; None when it is not a single-token fixed-price order."""
+    try:
+        current = raw["price"]["current"]
+        price = int(current["value"]) / (10 ** int(current.get("decimals", 18)))
+        params = raw["protocol_data"]["parameters"]
+        offer = params["offer"][0]
+        token_id = str(offer["identifierOrCriteria"])
+        expires = float(params.get("endTime") or 0)
+        order_hash = str(raw.get("order_hash") or raw.get("orderHash"))
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None
+    if price <= 0 or not order_hash:
+        return None
+    return Listing(order_hash, token_id, price, expires, raw)
+
+
+class ListingBook:
+    """
+    Listings of one collection: a price-sorted index for cheapest/depth queries
+    and an expiry heap so expired orders are evicted without scanning.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_hash: Dict[str, Listing] = {}
+        self._by_price: List[Tuple[float, str]] = []
+        self._expiry: List[Tuple[float, str]] = []
+        self.synced_at = 0.0
+        self.full_synced_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self._by_hash)
+
+    def _insert(self, listing: Listing) -> None:
+        self._drop(listing.order_hash)
+        self._by_hash[listing.order_hash] = listing
+        bisect.insort(self._by_price, (listing.price, listing.order_hash))
+        if listing.expires:
+            heapq.heappush(self._expiry, (listing.expires, listing.order_hash))
+
+    def _drop(self, order_hash: str) -> None:
+        old = self._by_hash.pop(order_hash, None)
+        if old is None:
+            return
+        i = bisect.bisect_left(self._by_price, (old.price, order_hash))
+        if i < len(self._by_price) and self._by_price[i][1] == order_hash:
+            del self._by_price[i]
+        # the expiry heap is cleaned lazily in _evict_expired
+
+    def _evict_expired(self, now: float) -> None:
+        while self._expiry and self._expiry[0][0] <= now:
+            expires, order_hash = heapq.heappop(self._expiry)
+            current = self._by_hash.get(order_hash)
+            if current is not None and current.expires == expires:
+                self._drop(order_hash)
+
+    def upsert(self, listings: Iterable[Listing]) -> None:
+        with self._lock:
+            for listing in listings:
+                self._insert(listing)
+
+    def remove(self, order_hashes: Iterable[str]) -> None:
+        with self._lock:
+            for order_hash in order_hashes:
+                self._drop(order_hash)
+
+    def replace(self, listings: Iterable[Listing], *, up_to: Optional[float] = None) -> None:
+        """
+        Make the book match ``listings``. With ``up_to`` only listings priced at
+        or below it are authoritative (a cheapest-first page): anything cheaper
+        that is missing from the page was cancelled or filled.
+        """
+        fresh = {l.order_hash: l for l in listings}
+        with self._lock:
+            if up_to is None:
+                stale = [h for h in self._by_hash if h not in fresh]
+            else:
+                stale = [h for p, h in self._by_price if p <= up_to and h not in fresh]
+            for order_hash in stale:
+                self._drop(order_hash)
+            for listing in fresh.values():
+                current = self._by_hash.get(listing.order_hash)
+                if current is None or current.price != listing.price or current.expires != listing.expires:
+                    self._insert(listing)
+            if up_to is None:
+                self._expiry = [(l.expires, l.order_hash) for l in self._by_hash.values() if l.expires]
+                heapq.heapify(self._expiry)
+
+    def cheapest(self, now: Optional[float] = None) -> Optional[Listing]:
+        with self._lock:
+            self._evict_expired(now or time.time())
+            return self._by_hash[self._by_price[0][1]] if self._by_price else None
+
+    def depth(self, max_price: float, now: Optional[float] = None) -> int:
+        """Number of live listings priced at or below ``max_price``."""
+        with self._lock:
+            self._evict_expired(now or time.time())
+            return bisect.bisect_right(self._by_price, (max_price, "\uffff"))
+
+    def for_token(self, token_id: str) -> Optional[Listing]:
+        with self._lock:
+            self._evict_expired(time.time())
+            for _, order_hash in self._by_price:
+                listing = self._by_hash[order_hash]
+                if listing.token_id == str(token_id):
+                    return listing
+        return None
+
+
+_books: Dict[str, ListingBook] = {}
+_slugs: Dict[str, str] = {}
+_books_lock = threading.Lock()
+_feed: Dict[str, Any] = {"thread": None, "wake": threading.Event(), "stop": False}
+
+
+def book(contract: str) -> ListingBook:
+    key = contract.lower()
+    with _books_lock:
+        current = _books.get(key)
+        if current is None:
+            current = _books[key] = ListingBook()
+        return current
+
+
+async def _slug(contract: str) -> str:
+    from . import opensea_async
+
+    key = contract.lower()
+    if key not in _slugs:
+        r = await opensea_async._client().get(
+            f"{opensea_async.BASE}/chain/{opensea_async.chain_name()}/contract/{contract}"
+        )
+        r.raise_for_status()
+        _slugs[key] = str(r.json()["collection"])
+    return _slugs[key]
+
+
+async def _pages(path: str, max_pages: int) -> Tuple[List[Listing], bool]:
+    """Up to ``max_pages`` pages of listings and whether the listing was exhausted."""
+    from . import opensea_async
+
+    out: List[Listing] = []
+    cursor: Optional[str] = None
+    for _ in range(max(1, max_pages)):
+        params: Dict[str, Any] = {"limit": 100}
+        if cursor:
+            params["next"] = cursor
+        r = await opensea_async._client().get(f"{opensea_async.BASE}{path}", params=params)
+        r.raise_for_status()
+        data = r.json()
+        out.extend(l for l in (parse_listing(raw) for raw in data.get("listings") or []) if l is not None)
+        cursor = data.get("next")
+        if not cursor:
+            return out, True
+    return out, False
+
+
+async def sync_contract(contract: str) -> None:
+    """
+    Bulk-load the collection every OPENSEA_LISTINGS_FULL_SEC, otherwise refresh
+    the cheapest page only and reconcile the price range it covers.
+    """
+    b = book(contract)
+    slug = await _slug(contract)
+    now = time.time()
+    max_pages = int(getattr(settings, "OPENSEA_LISTINGS_MAX_PAGES", 5) or 5)
+    full_every = float(getattr(settings, "OPENSEA_LISTINGS_FULL_SEC", 600.0) or 600.0)
+    if not b.full_synced_at or now - b.full_synced_at >= full_every:
+        items, complete = await _pages(f"/listings/collection/{slug}/all", max_pages)
+        if complete:
+            b.replace(items)
+        else:
+            b.upsert(items)
+        b.full_synced_at = now
+    # the cheapest page is authoritative for the price range it covers
+    page, complete = await _pages(f"/listings/collection/{slug}/best", 1)
+    b.replace(page, up_to=float("inf") if complete else max((l.price for l in page), default=0.0))
+    b.synced_at = now
+
+
+async def sync_many(watchlist: Iterable[str]) -> None:
+    async def one(contract: str) -> None:
+        try:
+            await sync_contract(contract)
+        except Exception as exc:
+            log(f"[LISTINGS][ERR] {contract[:10]}…: {exc}")
+
+    await asyncio.gather(*(one(c) for c in watchlist if isinstance(c, str) and c))
+
+
+def _interval() -> float:
+    return max(2.0, float(getattr(settings, "OPENSEA_LISTINGS_REFRESH_SEC", 20.0) or 20.0))
+
+
+def _feed_loop() -> None:
+    from .moralis_async import run_sync
+
+    while not _feed["stop"]:
+        if settings.OPENSEA_API_KEY:
+            try:
+                run_sync(sync_many(contracts() or []), timeout=120.0)
+            except Exception as exc:
+                log(f"[LISTINGS][ERR] refresh: {exc}")
+        _feed["wake"].wait(_interval())
+        _feed["wake"].clear()
+
+
+def start_feed() -> None:
+    """Start the background mirror refresher (idempotent)."""
+    thread = _feed["thread"]
+    if thread is not None and thread.is_alive():
+        return
+    _feed["stop"] = False
+    thread = threading.Thread(target=_feed_loop, name="listings-feed", daemon=True)
+    _feed["thread"] = thread
+    thread.start()
+
+
+def stop_feed() -> None:
+    _feed["stop"] = True
+    _feed["wake"].set()
+
+
+def cheapest(contract: str) -> Optional[Listing]:
+    """Cheapest live listing from the mirror; never touches the network."""
+    start_feed()
+    return book(contract).cheapest()
+
+
+def depth(contract: str, max_price: float) -> int:
+    start_feed()
+    return book(contract).depth(max_price)
+
+
+def snapshot() -> Dict[str, Any]:
+    now = time.time()
+    with _books_lock:
+        items = list(_books.items())
+    out = {}
+    for contract, b in items:
+        best = b.cheapest(now)
+        out[contract] = {
+            "listings": len(b),
+            "cheapest": best.price if best else None,
+            "token_id": best.token_id if best else None,
+            "age_sec": round(now - b.synced_at, 1) if b.synced_at else None,
+        }
+    return out
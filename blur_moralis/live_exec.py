@@ -1,56 +1,80 @@
-import httpx
 from typing import Tuple, Optional
 from web3 import Web3
 from eth_account import Account
 from .config import settings
 from .runtime import log
+from .nonce_manager import NonceManager
+from . import gas_oracle, listings, opensea_async
 
 class LiveNotConfigured(Exception): pass
 
 class OpenSeaExecutor:
-    BASE = "https://api.opensea.io/api/v2"
+    BASE = opensea_async.BASE
     def __init__(self, w3: Web3, address: str, private_key: str):
         if not settings.OPENSEA_API_KEY:
             raise LiveNotConfigured("Missing OPENSEA_API_KEY")
         self.w3=w3
         self.addr=Web3.to_checksum_address(address) if address else Account.from_key(private_key).address
         self.pk=private_key
-        self.client=httpx.Client(timeout=30, headers={"X-API-KEY": settings.OPENSEA_API_KEY, "Accept":"application/json"})
         self.chain=(settings.CHAIN or "eth")
+        self.nonces=NonceManager(self._pending_and_chain)
+
+    def _pending_and_chain(self)->Tuple[int,int]:
+        from .executor import read_chain_state
+        state=read_chain_state(self.w3, self.addr)
+        return state.nonce, state.chain_id
+
+    def chain_id(self)->int:
+        """Chain id, asked once per provider (the nonce sync fetches it for free)."""
+        if self.nonces.chain_id is None:
+            self.nonces.chain_id=int(self.w3.eth.chain_id)
+        return self.nonces.chain_id
 
     def _chain(self)->str:
-        c=(self.chain or 'eth').lower()
-        if c in ('eth','ethereum','mainnet'): return 'ethereum'
-        if c in ('polygon','matic'): return 'matic'
-        return 'ethereum'
+        return opensea_async.chain_name(self.chain)
+
+    def _mirrored_order(self, contract: str, token_id: str) -> Optional[dict]:
+        listing=listings.book(contract).for_token(token_id)
+        return listing.order if listing else None
 
     def _gas_params(self)->Tuple[int,int]:
-        max_fee=int(Web3.to_wei(float(getattr(settings,"GAS_MAX_FEE_GWEI",25.0)),"gwei"))
+        cap=int(Web3.to_wei(float(getattr(settings,"GAS_MAX_FEE_GWEI",25.0)),"gwei"))
+        quoted=gas_oracle.fees()
+        if quoted:
+            max_fee=min(quoted[0], cap)
+            return max_fee, min(quoted[1], max_fee)
         prio=int(Web3.to_wei(float(getattr(settings,"GAS_PRIORITY_GWEI",1.5)),"gwei"))
-        return max_fee, prio
+        return cap, prio
 
     def best_listing(self, contract: str, token_id: str) -> Optional[dict]:
-        r=self.client.get(f"{self.BASE}/listings", params={"asset_contract_address":contract, "token_ids": token_id, "limit": 1, "order_by":"eth_price", "order_direction":"asc"})
-        r.raise_for_status(); data=r.json()
-        orders=(data.get("listings") or data.get("orders") or [])
-        return orders[0] if orders else None
+        return opensea_async.call(opensea_async.best_listing(contract, token_id))
 
     def fulfillment_data(self, order: dict) -> dict:
-        payload={"listing": order, "chain": self._chain(), "taker": self.addr}
-        r=self.client.post(f"{self.BASE}/listings/fulfillment_data", json=payload)
-        r.raise_for_status(); return r.json()
+        return opensea_async.call(opensea_async.fulfillment_data(order, self._chain(), self.addr))
+
+    def prefetch(self, contract: str, token_id: str) -> None:
+        """Start fetching listing and fulfilment data while the signal is still being evaluated."""
+        opensea_async.prefetch(contract, token_id, self._chain(), self.addr, self._mirrored_order(contract, token_id))
 
     def buy_token(self, contract: str, token_id: str)->str:
-        order=self.best_listing(contract, token_id)
-        if not order: raise RuntimeError("No OpenSea listing found for token")
-        fd=self.fulfillment_data(order)
-        tx=fd.get("transaction") or fd.get("fulfillment_data",{}).get("transaction")
-        if not tx or "to" not in tx or "data" not in tx:
-            raise RuntimeError("No transaction data from OpenSea")
+        pending=opensea_async.take(contract, token_id, self._chain(), self.addr, self._mirrored_order(contract, token_id))
+        # chain-side preparation runs here while OpenSea answers on the async loop
         max_fee, prio = self._gas_params()
-        txd={"from":self.addr,"to":Web3.to_checksum_address(tx["to"]),"data":tx["data"],"value":int(tx.get("value","0")),
-             "nonce":self.w3.eth.get_transaction_count(self.addr),"maxFeePerGas":max_fee,"maxPriorityFeePerGas":prio,
-             "gas":min(int(tx.get("gas","500000")), int(getattr(settings,"GAS_LIMIT_CAP",500000))),"chainId":self.w3.eth.chain_id,"type":2}
-        signed=self.w3.eth.account.sign_transaction(txd, private_key=self.pk)
-        h=self.w3.eth.send_raw_transaction(signed.rawTransaction).hex()
-        log(f"[LIVE][TX][OS] {h} -> {txd['to']} val={txd['value']}"); return h
+        nonce=self.nonces.reserve()
+        try:
+            chain_id=self.chain_id()
+            prepared=pending.result(timeout=30)
+            if not prepared: raise RuntimeError("No OpenSea listing found for token")
+            tx=prepared.get("transaction")
+            if not tx or "to" not in tx or "data" not in tx:
+                raise RuntimeError("No transaction data from OpenSea")
+            txd={"from":self.addr,"to":Web3.to_checksum_address(tx["to"]),"data":tx["data"],"value":int(tx.get("value","0")),
+                 "nonce":nonce,"maxFeePerGas":max_fee,"maxPriorityFeePerGas":prio,
+                 "gas":min(int(tx.get("gas","500000")), int(getattr(settings,"GAS_LIMIT_CAP",500000))),"chainId":chain_id,"type":2}
+            signed=self.w3.eth.account.sign_transaction(txd, private_key=self.pk)
+            h=self.w3.eth.send_raw_transaction(signed.rawTransaction).hex()
+        except Exception as e:
+            self.nonces.failed(nonce, e)
+            raise
+        self.nonces.sent(nonce, h)
+        log(f"[LIVE][TX][OS] {h} -> {txd['to']} val={txd['value']} nonce={nonce}"); return h
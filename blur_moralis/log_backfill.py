@@ -0,0 +1,233 @@
+"""Boot-time backfill of marketplace sales from eth_getLogs, chunked across RPC endpoints."""
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+from . import chain_events, rpc_pool, trade_store
+from .config import contracts, settings
+from .runtime import log
+
+# Seconds per block, to turn the trade window into a block range.
+_BLOCK_TIME = {"eth": 12.0, "ethereum": 12.0, "polygon": 2.1, "matic": 2.1}
+
+# Error texts providers use when a range holds too many logs, and when it
+# spans more blocks than they serve; both are split. Anything else (rate
+# limits, quotas, outages) is a failure of the endpoint, not of the range.
+_TOO_MANY = ("query returned more than", "response size", "too many results")
+_RANGE_LIMIT = ("block range", "range too large", "range is too large", "too wide", "blocks range")
+
+# Smallest chunk handed out for fresh ranges; split ranges may go lower.
+_MIN_CHUNK = 16
+
+# Failures after which a worker gives its endpoint up.
+_MAX_FAILURES = 3
+
+# Grow the chunk when a range returned fewer logs than this.
+_SPARSE = 200
+
+_RECEIPT_BATCH = 50
+
+Range = Tuple[int, int]
+
+
+class _Ranges:
+    """Shared work list: an advancing cursor plus split-off ranges to retry."""
+
+    def __init__(self, start: int, end: int, chunk: int, max_chunk: int):
+        self._lock = threading.Lock()
+        self._next = start
+        self._end = end
+        self._retry: Deque[Range] = deque()
+        self.chunk = max(1, chunk)
+        self._max = max(self.chunk, max_chunk)
+
+    def take(self) -> Optional[Range]:
+        with self._lock:
+            if self._retry:
+                return self._retry.popleft()
+            if self._next > self._end:
+                return None
+            start = self._next
+            end = min(self._end, start + self.chunk - 1)
+            self._next = end + 1
+            return start, end
+
+    def give_back(self, rng: Range) -> None:
+        with self._lock:
+            self._retry.append(rng)
+
+    def split(self, rng: Range, *, ceiling: bool = False) -> None:
+        """
+        Retry ``rng`` as two halves (callers handle single-block ranges). With
+        ``ceiling`` the endpoint refused the span itself, so chunks never grow
+        back to it.
+        """
+        start, end = rng
+        mid = (start + end) // 2
+        half = (end - start + 1) // 2
+        with self._lock:
+            self.chunk = max(_MIN_CHUNK, min(self.chunk, half))
+            if ceiling:
+                self._max = max(_MIN_CHUNK, min(self._max, half))
+            self._retry.extend([(start, mid), (mid + 1, end)])
+
+    def pending(self) -> bool:
+        with self._lock:
+            return bool(self._retry) or self._next <= self._end
+
+    def sparse(self, found: int) -> None:
+        if found < _SPARSE:
+            with self._lock:
+                self.chunk = min(self._max, self.chunk * 2)
+
+
+def _int(value: Any) -> int:
+    return int(value, 16) if isinstance(value, str) else int(value)
+
+
+def _worker(ep: rpc_pool.RpcEndpoint, ranges: _Ranges, watched: List[str],
+            out: Dict[str, Set[int]], out_lock: threading.Lock) -> None:
+    """Drain ``ranges`` through one endpoint; collect tx hash -> block of watched transfers."""
+    pool = rpc_pool.pool()
+    failures = 0
+
+    def fail(rng: Range, reason: Any, *, requeue: bool = True) -> None:
+        nonlocal failures
+        failures += 1
+        if requeue:
+            ranges.give_back(rng)
+        log(f"[BACKFILL] {ep.url} {rng[0]}-{rng[1]}: {reason}")
+        if failures < _MAX_FAILURES:
+            time.sleep(min(10.0, 0.5 * 2 ** failures))
+
+    while failures < _MAX_FAILURES:
+        rng = ranges.take()
+        if rng is None:
+            return
+        params = [{"fromBlock": hex(rng[0]), "toBlock": hex(rng[1]), "address": watched,
+                   "topics": [chain_events.TRANSFER_TOPIC]}]
+        start = time.perf_counter()
+        try:
+            reply = ep.provider.make_request("eth_getLogs", params)
+        except Exception as exc:
+            pool.report(ep, None)
+            fail(rng, exc)
+            continue
+        if "error" in reply:
+            error = reply.get("error")
+            message = str(error.get("message") if isinstance(error, dict) else error).lower()
+            too_wide = any(marker in message for marker in _RANGE_LIMIT)
+            if not too_wide and not any(marker in message for marker in _TOO_MANY):
+                pool.report(ep, None)
+                fail(rng, message)
+            elif rng[0] == rng[1]:
+                fail(rng, f"single block too large: {message}", requeue=False)
+            else:
+                ranges.split(rng, ceiling=too_wide)
+            continue
+        failures = 0  # only consecutive failures give an endpoint up
+        pool.report(ep, time.perf_counter() - start)
+        entries = reply.get("result") or []
+        ranges.sparse(len(entries))
+        with out_lock:
+            for entry in entries:
+                if not entry.get("removed"):
+                    out.setdefault(entry["transactionHash"], set()).add(_int(entry["blockNumber"]))
+
+
+def _fetch_batched(method: str, args: List[List[Any]]) -> List[Dict[str, Any]]:
+    pool = rpc_pool.pool()
+    replies: List[Dict[str, Any]] = []
+    for i in range(0, len(args), _RECEIPT_BATCH):
+        chunk = args[i:i + _RECEIPT_BATCH]
+        replies.extend(pool.batch([(method, a) for a in chunk]))
+    return replies
+
+
+def backfill(window_sec: Optional[float] = None) -> int:
+    """
+    Walk the trade window's block range for every watched contract and ingest
+    the Seaport sales found; returns the number of new trades.
+    """
+    watched = [c for c in (contracts() or []) if isinstance(c, str) and c]
+    pool = rpc_pool.pool()
+    endpoints = pool.healthy()
+    if not watched or not endpoints:
+        return 0
+    window = window_sec if window_sec is not None else trade_store._window_sec()
+    head = int(pool.web3().eth.block_number)
+    per_block = _BLOCK_TIME.get((settings.CHAIN or "").lower(), 12.0)
+    first = max(0, head - int(window / per_block * 1.2))
+    ranges = _Ranges(
+        first, head,
+        int(getattr(settings, "LOGS_CHUNK_BLOCKS", 2000) or 2000),
+        int(getattr(settings, "LOGS_CHUNK_MAX", 10000) or 10000),
+    )
+    started = time.time()
+    txs: Dict[str, Set[int]] = {}
+    txs_lock = threading.Lock()
+    workers = [
+        threading.Thread(target=_worker, args=(ep, ranges, watched, txs, txs_lock), name=f"logs-{n}", daemon=True)
+        for n, ep in enumerate(endpoints)
+    ]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    if ranges.pending():
+        log(f"[BACKFILL][WARN] blocks {first}-{head}: endpoints gave up before every range was read")
+    if not txs:
+        log(f"[BACKFILL] blocks {first}-{head}: no transfers of watched contracts")
+        return 0
+
+    hashes = sorted(txs)
+    blocks = sorted({b for bs in txs.values() for b in bs})
+    receipts = _fetch_batched("eth_getTransactionReceipt", [[h] for h in hashes])
+    headers = _fetch_batched("eth_getBlockByNumber", [[hex(b), False] for b in blocks])
+    block_ts = {
+        _int(h["result"]["number"]): float(_int(h["result"]["timestamp"]))
+        for h in headers if isinstance(h.get("result"), dict)
+    }
+    seaport = {a.lower() for a in chain_events.SEAPORT_ADDRESSES}
+    by_contract: Dict[str, List[Dict[str, Any]]] = {}
+    for reply in receipts:
+        receipt = reply.get("result")
+        if not isinstance(receipt, dict):
+            continue
+        for entry in receipt.get("logs") or []:
+            if str(entry.get("address", "")).lower() not in seaport:
+                continue
+            ts = block_ts.get(_int(entry["blockNumber"]))
+            for record in chain_events.decode_fill(entry, watched, ts):
+                by_contract.setdefault(record["token_address"], []).append(record)
+    added = sum(trade_store.ingest(contract, records, source="logs") for contract, records in by_contract.items())
+    log(
+        f"[BACKFILL] blocks {first}-{head} via {len(endpoints)} endpoint(s): "
+        f"{len(hashes)} txs, {added} sales in {time.time() - started:.1f}s (chunk={ranges.chunk})"
+    )
+    return added
+
+
+_state: Dict[str, Any] = {"thread": None}
+
+
+def start() -> None:
+    """Run the backfill once in the background (LOGS_BACKFILL)."""
+    if not getattr(settings, "LOGS_BACKFILL", True):
+        return
+    thread = _state["thread"]
+    if thread is not None and thread.is_alive():
+        return
+
+    def run() -> None:
+        try:
+            backfill()
+        except Exception as exc:
+            log(f"[BACKFILL][ERR] {exc}")
+
+    thread = threading.Thread(target=run, name="logs-backfill", daemon=True)
+    _state["thread"] = thread
+    thread.start()
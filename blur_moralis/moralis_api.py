@@ -1,12 +1,15 @@
-import time, httpx
+import atexit, threading, time, httpx
 from typing import Optional, List, Dict, Any
 from .config import settings
 from .runtime import log
+from . import moralis_cache
+from .cu_budget import scheduler as _scheduler
+from .singleflight import flight
 
-_last_call_ts = {}  # key -> ts
 _usage_cache: Dict[str, Any] = {"data": None, "fingerprint": None}
 _last_usage_log_ts: float = 0.0
 _last_usage_error_ts: float = 0.0
+_last_usage_refresh_ts: float = 0.0
 _balance_cache: Dict[str, int] = {}
 
 _BALANCE_ENDPOINTS = (
@@ -19,14 +22,115 @@ _TRADES_ENDPOINTS = (
     "https://deep-index.moralis.io/api/v2/nft/{address}/trades",
 )
 
-def _allow(key: str, *, gap: Optional[int] = None) -> bool:
-    now=time.time()
-    gap = gap if gap is not None else max(5, int(getattr(settings, "MORALIS_RATE_LIMIT_SEC", 60)))
-    ts=_last_call_ts.get(key, 0)
-    if now - ts >= gap:
-        _last_call_ts[key]=now
-        return True
-    return False
+_USAGE_ENDPOINTS = (
+    ("https://deep-index.moralis.io/api/v2.2/info/usage", {"type": "evm"}),
+    ("https://deep-index.moralis.io/api/v2.2/info/web3-api-usage", {"type": "evm"}),
+    ("https://deep-index.moralis.io/api/v2/info/usage", {"type": "evm"}),
+    ("https://deep-index.moralis.io/api/v2.2/info/usage", None),
+    ("https://deep-index.moralis.io/api/v2.2/info/web3-api-usage", None),
+    ("https://deep-index.moralis.io/api/v2/info/usage", None),
+)
+
+# (family, chain) -> {"preferred": idx|None, "dead": {idx: until_ts}, "ok": {idx: n}, "missing": {idx: n}}
+_endpoint_state: Dict[tuple, Dict[str, Any]] = {}
+_endpoint_lock = threading.Lock()
+
+def _endpoint_entry(family: str, chain: str) -> Dict[str, Any]:
+    return _endpoint_state.setdefault(
+        (family, chain), {"preferred": None, "dead": {}, "ok": {}, "missing": {}}
+    )
+
+def _endpoint_order(family: str, chain: str, count: int) -> List[int]:
+    """
+    Candidate indices to try: last working variant first, variants that
+    recently returned 404 skipped until their TTL lapses (all of them are
+    retried if every variant is currently marked dead).
+    """
+    now = time.time()
+    with _endpoint_lock:
+        entry = _endpoint_entry(family, chain)
+        dead = entry["dead"]
+        for idx in [i for i, until in dead.items() if until <= now]:
+            dead.pop(idx, None)
+        order = [i for i in range(count) if i not in dead]
+        preferred = entry["preferred"]
+        if preferred in order:
+            order.remove(preferred)
+            order.insert(0, preferred)
+    return order or list(range(count))
+
+def _endpoint_ok(family: str, chain: str, idx: int) -> None:
+    with _endpoint_lock:
+        entry = _endpoint_entry(family, chain)
+        entry["preferred"] = idx
+        entry["dead"].pop(idx, None)
+        entry["ok"][idx] = entry["ok"].get(idx, 0) + 1
+
+def _endpoint_missing(family: str, chain: str, idx: int) -> None:
+    ttl = max(0, int(getattr(settings, "MORALIS_ENDPOINT_NEG_TTL_SEC", 3600)))
+    with _endpoint_lock:
+        entry = _endpoint_entry(family, chain)
+        entry["dead"][idx] = time.time() + ttl
+        entry["missing"][idx] = entry["missing"].get(idx, 0) + 1
+        if entry["preferred"] == idx:
+            entry["preferred"] = None
+
+def endpoint_stats() -> Dict[str, Any]:
+    """Per-(family, chain) counters of which endpoint variant answers."""
+    families = {"balance": _BALANCE_ENDPOINTS, "trades": _TRADES_ENDPOINTS, "usage": _USAGE_ENDPOINTS}
+    now = time.time()
+    out: Dict[str, Any] = {}
+    with _endpoint_lock:
+        for (family, chain), entry in _endpoint_state.items():
+            candidates = families.get(family, ())
+            variants = []
+            for idx, candidate in enumerate(candidates):
+                url, params = candidate if isinstance(candidate, tuple) else (candidate, None)
+                until = entry["dead"].get(idx)
+                variants.append({
+                    "url": url,
+                    "params": params or {},
+                    "ok": entry["ok"].get(idx, 0),
+                    "missing": entry["missing"].get(idx, 0),
+                    "dead_for_sec": round(until - now, 1) if until and until > now else 0.0,
+                    "preferred": entry["preferred"] == idx,
+                })
+            out[f"{family}:{chain}"] = variants
+    return out
+
+_gates_lock = threading.Lock()
+_gates_warm = False
+
+def _allow(key: str, *, gap: Optional[int] = None, priority: Optional[int] = None) -> bool:
+    """
+    Admission for one Moralis call: per-key gap (stretched under quota
+    pressure) plus the CU token bucket in cu_budget, served by priority.
+    """
+    global _gates_warm
+    if not _gates_warm:
+        with _gates_lock:
+            if not _gates_warm:
+                # Restore stamps from the previous process so a restart does not burst.
+                _scheduler.restore(moralis_cache.load_gates())
+                _gates_warm = True
+    if not _scheduler.acquire(key, gap=gap, priority=priority):
+        return False
+    moralis_cache.save_gate(key, time.time())
+    return True
+
+def _charge(key: str, *, priority: Optional[int] = None) -> bool:
+    """CU payment for one more page under an admission ``key`` already got from _allow."""
+    return _scheduler.charge(key, priority=priority)
+
+def _note_throttle(exc: httpx.HTTPStatusError) -> None:
+    if exc.response is None or exc.response.status_code != 429:
+        return
+    try:
+        retry_after = float(exc.response.headers.get("Retry-After") or 0) or None
+    except ValueError:
+        retry_after = None
+    _scheduler.throttled(retry_after)
+    log(f"[MORALIS][WARN] HTTP 429 — пауза {retry_after or 30:.0f}s, CU-бюджет обнулён")
 
 def _chain_param()->str:
     raw = getattr(settings, "MORALIS_TRADES_CHAIN", None) or settings.CHAIN or "eth"
@@ -35,51 +139,115 @@ def _chain_param()->str:
     if c in ("polygon","matic"): return "polygon"
     return "eth"
 
+_client_lock = threading.Lock()
+_client_state: Dict[str, Any] = {"client": None, "key": None}
+
+def _http2_enabled()->bool:
+    if not getattr(settings, "MORALIS_HTTP2", True):
+        return False
+    try:
+        import h2  # noqa: F401  (httpx[http2] extra)
+    except ImportError:
+        return False
+    return True
+
+def _client_limits()->httpx.Limits:
+    return httpx.Limits(
+        max_connections=int(getattr(settings, "MORALIS_MAX_CONNECTIONS", 10)),
+        max_keepalive_connections=int(getattr(settings, "MORALIS_MAX_KEEPALIVE", 5)),
+        keepalive_expiry=float(getattr(settings, "MORALIS_KEEPALIVE_SEC", 60.0)),
+    )
+
 def _client()->httpx.Client:
-    if not settings.MORALIS_API_KEY:
+    """
+    Process-wide pooled client (keep-alive, optional HTTP/2).
+    Rebuilt only when MORALIS_API_KEY changes; callers must not close it.
+    """
+    key = settings.MORALIS_API_KEY
+    if not key:
         raise RuntimeError("MORALIS_API_KEY missing")
-    return httpx.Client(timeout=20, headers={"X-API-Key": settings.MORALIS_API_KEY, "Accept":"application/json"})
+    client = _client_state["client"]
+    if client is not None and _client_state["key"] == key and not client.is_closed:
+        return client
+    with _client_lock:
+        client = _client_state["client"]
+        if client is not None and _client_state["key"] == key and not client.is_closed:
+            return client
+        fresh = httpx.Client(
+            timeout=20,
+            limits=_client_limits(),
+            http2=_http2_enabled(),
+            headers={"X-API-Key": key, "Accept":"application/json"},
+        )
+        _client_state.update({"client": fresh, "key": key})
+    if client is not None:
+        client.close()
+    return fresh
+
+def close_client()->None:
+    """Close the pooled client; the next call builds a new one."""
+    with _client_lock:
+        client = _client_state["client"]
+        _client_state.update({"client": None, "key": None})
+    if client is not None:
+        client.close()
+
+atexit.register(close_client)
 
 def native_balance(address:str)->Optional[int]:
     """
     Returns balance in wei via Moralis v2: /{address}/balance
-    Rate-limited by MORALIS_RATE_LIMIT_SEC to save CU.
+    Rate-limited by MORALIS_RATE_LIMIT_SEC to save CU; concurrent callers for
+    the same address share one request.
     """
+    return flight.do(("moralis:balance", address, _chain_param()), lambda: _native_balance(address))
+
+def _native_balance(address:str)->Optional[int]:
     key=f"bal:{address}:{_chain_param()}"
     cached=_balance_cache.get(key)
+    if cached is None:
+        cached=moralis_cache.load_balance(key)
+        if cached is not None:
+            _balance_cache[key] = cached
     if not address:
         return cached
     if not _allow(key):
         return cached  # skip to save CU
     last_error: Optional[Exception] = None
     last_status: Optional[int] = None
-    params = {"chain": _chain_param()}
+    chain = _chain_param()
+    params = {"chain": chain}
     try:
-        with _client() as c:
-            for endpoint in _BALANCE_ENDPOINTS:
-                url = endpoint.format(address=address)
-                try:
-                    r = c.get(url, params=params)
-                    if r.status_code == 404:
-                        last_status = 404
-                        continue
-                    r.raise_for_status()
-                except httpx.HTTPStatusError as exc:
-                    last_error = exc
-                    last_status = exc.response.status_code if exc.response is not None else None
-                    if last_status == 404:
-                        continue
-                    break
-                except Exception as exc:
-                    last_error = exc
-                    last_status = None
-                    break
-                else:
-                    data = r.json()
-                    bal = int(data.get("balance") or 0)
-                    log(f"[MORALIS] balance ok {address[:8]}… -> {bal} via {url}")
-                    _balance_cache[key] = bal
-                    return bal
+        c = _client()
+        for idx in _endpoint_order("balance", chain, len(_BALANCE_ENDPOINTS)):
+            url = _BALANCE_ENDPOINTS[idx].format(address=address)
+            try:
+                r = c.get(url, params=params)
+                if r.status_code == 404:
+                    last_status = 404
+                    _endpoint_missing("balance", chain, idx)
+                    continue
+                r.raise_for_status()
+            except httpx.HTTPStatusError as exc:
+                last_error = exc
+                last_status = exc.response.status_code if exc.response is not None else None
+                _note_throttle(exc)
+                if last_status == 404:
+                    _endpoint_missing("balance", chain, idx)
+                    continue
+                break
+            except Exception as exc:
+                last_error = exc
+                last_status = None
+                break
+            else:
+                _endpoint_ok("balance", chain, idx)
+                data = r.json()
+                bal = int(data.get("balance") or 0)
+                log(f"[MORALIS] balance ok {address[:8]}… -> {bal} via {url}")
+                _balance_cache[key] = bal
+                moralis_cache.save_balance(key, bal)
+                return bal
     except Exception as exc:
         last_error = exc
         last_status = None
@@ -98,34 +266,39 @@ def recent_trades(contract:str, limit:int=2)->List[Dict[str,Any]]:
     key=f"trades:{contract}:{_chain_param()}"
     if not _allow(key):
         return []
-    params = {"chain": _chain_param(), "marketplace": "opensea", "limit": limit}
+    chain = _chain_param()
+    params = {"chain": chain, "marketplace": "opensea", "limit": limit}
     last_error: Optional[Exception] = None
     last_status: Optional[int] = None
     try:
-        with _client() as c:
-            for endpoint in _TRADES_ENDPOINTS:
-                url = endpoint.format(address=contract)
-                try:
-                    r = c.get(url, params=params)
-                    if r.status_code == 404:
-                        last_status = 404
-                        continue
-                    r.raise_for_status()
-                except httpx.HTTPStatusError as exc:
-                    last_error = exc
-                    last_status = exc.response.status_code if exc.response is not None else None
-                    if last_status == 404:
-                        continue
-                    break
-                except Exception as exc:
-                    last_error = exc
-                    last_status = None
-                    break
-                else:
-                    data = r.json()
-                    items = data.get("result") or data.get("trades") or []
-                    log(f"[MORALIS] trades {contract[:8]}… -> {len(items)} via {url}")
-                    return items[:limit]
+        c = _client()
+        for idx in _endpoint_order("trades", chain, len(_TRADES_ENDPOINTS)):
+            url = _TRADES_ENDPOINTS[idx].format(address=contract)
+            try:
+                r = c.get(url, params=params)
+                if r.status_code == 404:
+                    last_status = 404
+                    _endpoint_missing("trades", chain, idx)
+                    continue
+                r.raise_for_status()
+            except httpx.HTTPStatusError as exc:
+                last_error = exc
+                last_status = exc.response.status_code if exc.response is not None else None
+                _note_throttle(exc)
+                if last_status == 404:
+                    _endpoint_missing("trades", chain, idx)
+                    continue
+                break
+            except Exception as exc:
+                last_error = exc
+                last_status = None
+                break
+            else:
+                _endpoint_ok("trades", chain, idx)
+                data = r.json()
+                items = data.get("result") or data.get("trades") or []
+                log(f"[MORALIS] trades {contract[:8]}… -> {len(items)} via {url}")
+                return items[:limit]
     except Exception as exc:
         last_error = exc
         last_status = None
@@ -262,45 +435,41 @@ def current_cu_usage(force: bool = False) -> Optional[Dict[str, Any]]:
             _last_usage_log_ts = now
         return cache
 
-    endpoints = (
-        ("https://deep-index.moralis.io/api/v2.2/info/usage", {"type": "evm"}),
-        ("https://deep-index.moralis.io/api/v2.2/info/web3-api-usage", {"type": "evm"}),
-        ("https://deep-index.moralis.io/api/v2/info/usage", {"type": "evm"}),
-        ("https://deep-index.moralis.io/api/v2.2/info/usage", None),
-        ("https://deep-index.moralis.io/api/v2.2/info/web3-api-usage", None),
-        ("https://deep-index.moralis.io/api/v2/info/usage", None),
-    )
     last_error: Optional[Exception] = None
     last_status: Optional[int] = None
     try:
-        with _client() as c:
-            for url, params in endpoints:
-                try:
-                    r = c.get(url, params=params or None)
-                    if r.status_code == 204:
-                        continue
-                    r.raise_for_status()
-                    raw = r.json()
-                except httpx.HTTPStatusError as exc:
-                    last_error = exc
-                    last_status = exc.response.status_code if exc.response is not None else None
-                    if last_status == 404:
-                        continue
-                    continue
-                except Exception as exc:
-                    last_error = exc
-                    last_status = None
+        c = _client()
+        for idx in _endpoint_order("usage", "any", len(_USAGE_ENDPOINTS)):
+            url, params = _USAGE_ENDPOINTS[idx]
+            try:
+                r = c.get(url, params=params or None)
+                if r.status_code == 204:
                     continue
-                else:
-                    fields = _normalize_usage_payload(raw)
-                    payload = {"fetched_at": now, **fields, "raw": raw, "endpoint": url, "params": params or {}}
-                    fingerprint = _usage_fingerprint(payload)
-                    _usage_cache.update({"data": payload, "fingerprint": fingerprint})
-                    summary = _format_usage_summary(payload)
-                    log(f"[MORALIS][USAGE] Current CU Usage: {summary}")
-                    _last_usage_log_ts = now
-                    _last_usage_error_ts = now
-                    return payload
+                r.raise_for_status()
+                raw = r.json()
+            except httpx.HTTPStatusError as exc:
+                last_error = exc
+                last_status = exc.response.status_code if exc.response is not None else None
+                _note_throttle(exc)
+                if last_status == 404:
+                    _endpoint_missing("usage", "any", idx)
+                continue
+            except Exception as exc:
+                last_error = exc
+                last_status = None
+                continue
+            else:
+                _endpoint_ok("usage", "any", idx)
+                fields = _normalize_usage_payload(raw)
+                payload = {"fetched_at": now, **fields, "raw": raw, "endpoint": url, "params": params or {}}
+                _scheduler.update_quota(payload)
+                fingerprint = _usage_fingerprint(payload)
+                _usage_cache.update({"data": payload, "fingerprint": fingerprint})
+                summary = _format_usage_summary(payload)
+                log(f"[MORALIS][USAGE] Current CU Usage: {summary}")
+                _last_usage_log_ts = now
+                _last_usage_error_ts = now
+                return payload
     except Exception as exc:
         last_error = exc
         last_status = None
@@ -315,3 +484,20 @@ def current_cu_usage(force: bool = False) -> Optional[Dict[str, Any]]:
         log(f"[MORALIS][ERR] usage fetch failed: {last_error}")
         _last_usage_error_ts = now
     return cache
+
+
+def refresh_usage() -> None:
+    """
+    Re-read the quota every MORALIS_USAGE_REFRESH_SEC so the CU bucket tracks
+    it while no dashboard polls /api/moralis_usage.
+    """
+    global _last_usage_refresh_ts
+    every = float(getattr(settings, "MORALIS_USAGE_REFRESH_SEC", 300) or 0)
+    now = time.time()
+    if every <= 0 or not settings.MORALIS_API_KEY or now - _last_usage_refresh_ts < every:
+        return
+    _last_usage_refresh_ts = now
+    fetched = (_usage_cache.get("data") or {}).get("fetched_at")
+    if isinstance(fetched, (int, float)) and now - fetched < every:
+        return  # the dashboard read it recently enough
+    current_cu_usage()
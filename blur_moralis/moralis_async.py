@@ -0,0 +1,148 @@
+"""Shared asyncio loop and async client for Moralis trade pages; trade_store.sync_many fans them out."""
+from __future__ import annotations
+
+import asyncio
+import atexit
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from .config import settings
+from .moralis_api import (
+    _TRADES_ENDPOINTS,
+    _chain_param,
+    _client_limits,
+    _endpoint_missing,
+    _endpoint_ok,
+    _endpoint_order,
+    _http2_enabled,
+    _note_throttle,
+)
+from .runtime import log
+
+_state: Dict[str, Any] = {"loop": None, "thread": None, "client": None, "key": None}
+_state_lock = threading.Lock()
+
+
+def _loop() -> asyncio.AbstractEventLoop:
+    """Background event loop shared by every sync caller (engine thread, dashboard)."""
+    with _state_lock:
+        loop = _state["loop"]
+        # is_running() stays False until the thread gets scheduled; the started thread is the truth
+        if loop is not None and _state["thread"] is not None and _state["thread"].is_alive() and not loop.is_closed():
+            return loop
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, name="moralis-async", daemon=True)
+        _state.update({"loop": loop, "thread": thread, "client": None, "key": None})
+        thread.start()
+        return loop
+
+
+def _client() -> httpx.AsyncClient:
+    key = settings.MORALIS_API_KEY
+    if not key:
+        raise RuntimeError("MORALIS_API_KEY missing")
+    client = _state["client"]
+    if client is not None and _state["key"] == key and not client.is_closed:
+        return client
+    if client is not None:
+        asyncio.ensure_future(client.aclose())
+    client = httpx.AsyncClient(
+        timeout=20,
+        limits=_client_limits(),
+        http2=_http2_enabled(),
+        headers={"X-API-Key": key, "Accept": "application/json"},
+    )
+    _state.update({"client": client, "key": key})
+    return client
+
+
+async def trades_page_async(
+    contract: str,
+    *,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    from_date: Optional[str] = None,
+    to_date: Optional[str] = None,
+) -> Optional[Tuple[List[Dict[str, Any]], Optional[str]]]:
+    """
+    One page of /nft/{address}/trades (newest first) and the cursor of the next,
+    older page. Not rate-gated; returns None when every endpoint variant failed.
+    """
+    chain = _chain_param()
+    params: Dict[str, Any] = {"chain": chain, "marketplace": "opensea", "limit": limit}
+    if cursor:
+        params["cursor"] = cursor
+    if from_date:
+        params["from_date"] = from_date
+    if to_date:
+        params["to_date"] = to_date
+    last_error: Optional[Exception] = None
+    last_status: Optional[int] = None
+    try:
+        c = _client()
+        for idx in _endpoint_order("trades", chain, len(_TRADES_ENDPOINTS)):
+            url = _TRADES_ENDPOINTS[idx].format(address=contract)
+            try:
+                r = await c.get(url, params=params)
+                if r.status_code == 404:
+                    last_status = 404
+                    _endpoint_missing("trades", chain, idx)
+                    continue
+                r.raise_for_status()
+            except httpx.HTTPStatusError as exc:
+                last_error = exc
+                last_status = exc.response.status_code if exc.response is not None else None
+                _note_throttle(exc)
+                if last_status == 404:
+                    _endpoint_missing("trades", chain, idx)
+                    continue
+                break
+            except Exception as exc:
+                last_error = exc
+                last_status = None
+                break
+            else:
+                _endpoint_ok("trades", chain, idx)
+                data = r.json()
+                items = (data.get("result") or data.get("trades") or [])[:limit]
+                log(f"[MORALIS] trades {contract[:8]}… -> {len(items)} via {url}")
+                return items, (data.get("cursor") or None)
+    except Exception as exc:
+        last_error = exc
+        last_status = None
+
+    if last_status == 404:
+        log(f"[MORALIS][WARN] trades endpoint not found for {contract[:8]}…")
+    elif last_error:
+        log(f"[MORALIS][ERR] trades: {last_error}")
+    return None
+
+
+def run_sync(coro, *, timeout: float = 60.0):
+    """Run ``coro`` on the shared loop from a plain thread and wait for it."""
+    future = asyncio.run_coroutine_threadsafe(coro, _loop())
+    try:
+        return future.result(timeout=timeout)
+    except Exception:
+        future.cancel()
+        raise
+
+
+def close() -> None:
+    """Close the async client and stop the background loop."""
+    with _state_lock:
+        loop, client = _state["loop"], _state["client"]
+        _state.update({"loop": None, "thread": None, "client": None, "key": None})
+    if loop is None or loop.is_closed():
+        return
+    if client is not None:
+        try:
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop).result(timeout=5)
+        except Exception:
+            pass
+    loop.call_soon_threadsafe(loop.stop)
+
+
+atexit.register(close)
@@ -0,0 +1,196 @@
+"""Optional SQLite (WAL) cache of Moralis trades, balances and rate-gate stamps.
+
+Enabled when ``MORALIS_CACHE_PATH`` is set; every function is a no-op otherwise,
+so callers never need to check.
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .config import settings
+from .runtime import log
+
+_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS trades (
+        chain TEXT NOT NULL,
+        contract TEXT NOT NULL,
+        tx TEXT NOT NULL,
+        log_index TEXT NOT NULL,
+        ts REAL NOT NULL,
+        payload TEXT NOT NULL,
+        fetched_at REAL NOT NULL,
+        PRIMARY KEY (chain, contract, tx, log_index)
+    )""",
+    "CREATE INDEX IF NOT EXISTS trades_by_time ON trades (chain, contract, ts)",
+    """CREATE TABLE IF NOT EXISTS balances (
+        key TEXT PRIMARY KEY,
+        wei TEXT NOT NULL,
+        fetched_at REAL NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS gates (
+        key TEXT PRIMARY KEY,
+        ts REAL NOT NULL
+    )""",
+)
+
+_lock = threading.Lock()
+_state: Dict[str, Any] = {"conn": None, "path": None, "failed": None}
+
+
+def _conn() -> Optional[sqlite3.Connection]:
+    path = (getattr(settings, "MORALIS_CACHE_PATH", "") or "").strip()
+    if not path or path == _state["failed"]:
+        return None
+    conn = _state["conn"]
+    if conn is not None and _state["path"] == path:
+        return conn
+    if conn is not None:
+        conn.close()
+    try:
+        conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        for stmt in _SCHEMA:
+            conn.execute(stmt)
+    except sqlite3.Error as exc:
+        log(f"[CACHE][ERR] cannot open {path}: {exc}")
+        _state.update({"conn": None, "path": None, "failed": path})
+        return None
+    _state.update({"conn": conn, "path": path})
+    log(f"[CACHE] moralis cache at {path}")
+    return conn
+
+
+def enabled() -> bool:
+    with _lock:
+        return _conn() is not None
+
+
+def load_gates() -> Dict[str, float]:
+    with _lock:
+        conn = _conn()
+        if conn is None:
+            return {}
+        try:
+            return {k: float(ts) for k, ts in conn.execute("SELECT key, ts FROM gates")}
+        except sqlite3.Error as exc:
+            log(f"[CACHE][ERR] gates: {exc}")
+            return {}
+
+
+def save_gate(key: str, ts: float) -> None:
+    with _lock:
+        conn = _conn()
+        if conn is None:
+            return
+        try:
+            conn.execute("INSERT OR REPLACE INTO gates (key, ts) VALUES (?, ?)", (key, ts))
+        except sqlite3.Error as exc:
+            log(f"[CACHE][ERR] gate: {exc}")
+
+
+def load_balance(key: str) -> Optional[int]:
+    """Cached wei balance if younger than MORALIS_CACHE_BALANCE_TTL_SEC."""
+    ttl = float(getattr(settings, "MORALIS_CACHE_BALANCE_TTL_SEC", 300) or 0)
+    with _lock:
+        conn = _conn()
+        if conn is None:
+            return None
+        try:
+            row = conn.execute("SELECT wei, fetched_at FROM balances WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as exc:
+            log(f"[CACHE][ERR] balance: {exc}")
+            return None
+    if not row or time.time() - float(row[1]) > ttl:
+        return None
+    return int(row[0])
+
+
+def save_balance(key: str, wei: int) -> None:
+    with _lock:
+        conn = _conn()
+        if conn is None:
+            return
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO balances (key, wei, fetched_at) VALUES (?, ?, ?)",
+                (key, str(int(wei)), time.time()),
+            )
+        except sqlite3.Error as exc:
+            log(f"[CACHE][ERR] balance: {exc}")
+
+
+def load_trades(chain: str, contract: str, since: float) -> List[Dict[str, Any]]:
+    """Cached trade payloads with ``ts >= since`` fetched within MORALIS_CACHE_TRADES_TTL_SEC."""
+    ttl = float(getattr(settings, "MORALIS_CACHE_TRADES_TTL_SEC", 86400) or 0)
+    with _lock:
+        conn = _conn()
+        if conn is None:
+            return []
+        try:
+            rows = conn.execute(
+                "SELECT payload FROM trades WHERE chain = ? AND contract = ? AND ts >= ? AND fetched_at >= ?"
+                " ORDER BY ts",
+                (chain, contract.lower(), since, time.time() - ttl),
+            ).fetchall()
+        except sqlite3.Error as exc:
+            log(f"[CACHE][ERR] trades: {exc}")
+            return []
+    out = []
+    for (payload,) in rows:
+        try:
+            out.append(json.loads(payload))
+        except ValueError:
+            continue
+    return out
+
+
+def save_trades(
+    chain: str,
+    contract: str,
+    rows: Iterable[Tuple[float, Tuple[str, str], Dict[str, Any]]],
+    *,
+    prune_before: Optional[float] = None,
+) -> None:
+    """Insert ``(ts, (tx, log_index), payload)`` rows; optionally drop rows older than ``prune_before``."""
+    now = time.time()
+    params = [
+        (chain, contract.lower(), key[0], key[1], ts, json.dumps(trade, default=str), now)
+        for ts, key, trade in rows
+    ]
+    with _lock:
+        conn = _conn()
+        if conn is None:
+            return
+        try:
+            conn.execute("BEGIN")
+            if params:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO trades (chain, contract, tx, log_index, ts, payload, fetched_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    params,
+                )
+            if prune_before is not None:
+                conn.execute(
+                    "DELETE FROM trades WHERE chain = ? AND contract = ? AND ts < ?",
+                    (chain, contract.lower(), prune_before),
+                )
+            conn.execute("COMMIT")
+        except sqlite3.Error as exc:
+            try:
+                conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+            log(f"[CACHE][ERR] trades: {exc}")
+
+
+def close() -> None:
+    with _lock:
+        conn = _state["conn"]
+        _state.update({"conn": None, "path": None})
+    if conn is not None:
+        conn.close()
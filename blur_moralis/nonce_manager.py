@@ -0,0 +1,83 @@
+"""Local nonce allocation for one sending account, reconciled with the node's pending count."""
+from __future__ import annotations
+
+import heapq
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .config import settings
+from .runtime import log
+
+# Send errors after which the local counter can no longer be trusted.
+_RESYNC_ERRORS = ("nonce too low", "already known", "replacement transaction underpriced", "nonce too high")
+
+
+class NonceManager:
+    """
+    Hands out consecutive nonces without asking the node on every transaction.
+    ``fetch`` returns ``(pending_count, chain_id)``; it is consulted on first
+    use, after RPC_NONCE_RESYNC_SEC, and whenever a send error shows the
+    counter drifted. Nonces still unseen by the node after RPC_NONCE_DROP_SEC
+    are treated as dropped and get reused.
+    """
+
+    def __init__(self, fetch: Callable[[], Tuple[int, int]]):
+        self._fetch = fetch
+        self._lock = threading.Lock()
+        self._next: Optional[int] = None
+        self._synced_at = 0.0
+        self._inflight: Dict[int, Tuple[str, float]] = {}
+        self._free: List[int] = []  # heap of released nonces below _next
+        self.chain_id: Optional[int] = None
+
+    def _sync(self, now: float) -> None:
+        pending, chain_id = self._fetch()
+        self.chain_id = chain_id
+        # anything below the pending count is mined or known to the node
+        for nonce in [n for n in self._inflight if n < pending]:
+            del self._inflight[nonce]
+        self._free = [n for n in self._free if n >= pending]
+        heapq.heapify(self._free)
+        drop_after = float(getattr(settings, "RPC_NONCE_DROP_SEC", 180.0) or 180.0)
+        dropped = [n for n, (_, ts) in self._inflight.items() if now - ts > drop_after]
+        if dropped:
+            log(f"[NONCE] {len(dropped)} tx(s) not seen by the node, reusing from nonce {pending}")
+            self._inflight.clear()
+            self._free = []
+            self._next = pending
+        else:
+            self._next = max(pending, self._next or 0)
+        self._synced_at = now
+
+    def reserve(self) -> int:
+        now = time.time()
+        with self._lock:
+            resync = float(getattr(settings, "RPC_NONCE_RESYNC_SEC", 30.0) or 30.0)
+            if self._next is None or now - self._synced_at > resync:
+                self._sync(now)
+            if self._free:
+                return heapq.heappop(self._free)
+            nonce = self._next
+            self._next += 1
+            return nonce
+
+    def sent(self, nonce: int, tx_hash: str) -> None:
+        with self._lock:
+            self._inflight[nonce] = (tx_hash, time.time())
+
+    def failed(self, nonce: int, error: BaseException) -> None:
+        """The transaction with ``nonce`` was not broadcast."""
+        text = str(error).lower()
+        with self._lock:
+            if any(marker in text for marker in _RESYNC_ERRORS):
+                self._next = None
+            elif self._next == nonce + 1:
+                self._next = nonce
+            else:
+                # a later nonce is already out: fill this gap first
+                heapq.heappush(self._free, nonce)
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            return {"next": self._next, "inflight": sorted(self._inflight), "chain_id": self.chain_id}
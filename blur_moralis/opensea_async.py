@@ -0,0 +1,134 @@
+"""Async OpenSea client on the shared event loop, with prefetched buy preparation."""
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+from .config import settings
+from .moralis_api import _client_limits, _http2_enabled
+from .moralis_async import _loop, run_sync
+from .runtime import log
+
+BASE = "https://api.opensea.io/api/v2"
+
+_state: Dict[str, Any] = {"client": None, "key": None}
+
+# (contract, token_id) -> (scheduled_at, future of prepare())
+_prepared: Dict[Tuple[str, str], Tuple[float, concurrent.futures.Future]] = {}
+_prepared_lock = threading.Lock()
+
+
+def chain_name(chain: Optional[str] = None) -> str:
+    c = (chain or settings.CHAIN or "eth").lower()
+    if c in ("polygon", "matic"):
+        return "matic"
+    return "ethereum"
+
+
+def _client() -> httpx.AsyncClient:
+    """Pooled client (keep-alive, optional HTTP/2); only used on the shared loop."""
+    key = settings.OPENSEA_API_KEY
+    if not key:
+        raise RuntimeError("OPENSEA_API_KEY missing")
+    client = _state["client"]
+    if client is not None and _state["key"] == key and not client.is_closed:
+        return client
+    if client is not None:
+        asyncio.ensure_future(client.aclose())
+    client = httpx.AsyncClient(
+        timeout=30,
+        limits=_client_limits(),
+        http2=_http2_enabled(),
+        headers={"X-API-KEY": key, "Accept": "application/json"},
+    )
+    _state.update({"client": client, "key": key})
+    return client
+
+
+async def best_listing(contract: str, token_id: str) -> Optional[dict]:
+    r = await _client().get(
+        f"{BASE}/listings",
+        params={"asset_contract_address": contract, "token_ids": token_id, "limit": 1,
+                "order_by": "eth_price", "order_direction": "asc"},
+    )
+    r.raise_for_status()
+    data = r.json()
+    orders = data.get("listings") or data.get("orders") or []
+    return orders[0] if orders else None
+
+
+async def fulfillment_data(order: dict, chain: str, taker: str) -> dict:
+    payload = {"listing": order, "chain": chain, "taker": taker}
+    r = await _client().post(f"{BASE}/listings/fulfillment_data", json=payload)
+    r.raise_for_status()
+    return r.json()
+
+
+async def prepare(
+    contract: str, token_id: str, chain: str, taker: str, order: Optional[dict] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Cheapest listing of the token (``order`` when the caller already knows it)
+    plus its fulfilment transaction; None if not listed.
+    """
+    order = order or await best_listing(contract, token_id)
+    if not order:
+        return None
+    fd = await fulfillment_data(order, chain, taker)
+    tx = fd.get("transaction") or fd.get("fulfillment_data", {}).get("transaction")
+    return {"order": order, "transaction": tx, "ts": time.time()}
+
+
+def _ttl() -> float:
+    return float(getattr(settings, "OPENSEA_PREFETCH_TTL_SEC", 15.0) or 0.0)
+
+
+def prefetch(
+    contract: str, token_id: str, chain: str, taker: str, order: Optional[dict] = None
+) -> concurrent.futures.Future:
+    """Start preparing a buy in the background; repeated calls reuse a fresh one."""
+    key = (contract.lower(), str(token_id))
+    now = time.time()
+    with _prepared_lock:
+        for k in [k for k, (ts, _) in _prepared.items() if now - ts > _ttl()]:
+            del _prepared[k]
+        entry = _prepared.get(key)
+        if entry is not None and not (entry[1].done() and entry[1].exception() is not None):
+            return entry[1]
+        future = asyncio.run_coroutine_threadsafe(prepare(contract, token_id, chain, taker, order), _loop())
+        _prepared[key] = (now, future)
+        return future
+
+
+def take(
+    contract: str, token_id: str, chain: str, taker: str, order: Optional[dict] = None
+) -> concurrent.futures.Future:
+    """The prefetched preparation for the token (started now if there is none); consumes it."""
+    future = prefetch(contract, token_id, chain, taker, order)
+    with _prepared_lock:
+        _prepared.pop((contract.lower(), str(token_id)), None)
+    return future
+
+
+def call(coro, *, timeout: float = 30.0):
+    """Blocking bridge for the sync executor API."""
+    return run_sync(coro, timeout=timeout)
+
+
+def close() -> None:
+    """Close the client; call before moralis_async.close() stops the loop."""
+    client = _state["client"]
+    _state.update({"client": None, "key": None})
+    with _prepared_lock:
+        _prepared.clear()
+    if client is None:
+        return
+    try:
+        run_sync(client.aclose(), timeout=5)
+    except Exception as exc:
+        log(f"[OPENSEA] client close failed: {exc}")
@@ -0,0 +1,221 @@
+"""Optional push feed: OpenSea Stream API (Phoenix channels over a websocket)."""
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from typing import Any, Dict, Optional
+
+from . import listings, trade_store
+from .config import contracts, settings
+from .moralis_async import _loop
+from .runtime import log
+from .trade_record import coerce_timestamp
+
+_HEARTBEAT_SEC = 30.0
+
+# Payment token symbol -> pricing asset, for sales the stream sends without usd_price.
+_PRICED = {"ETH": "eth", "WETH": "eth", "MATIC": "polygon", "WMATIC": "polygon", "POL": "polygon", "WPOL": "polygon"}
+
+_state: Dict[str, Any] = {
+    "future": None,
+    "connected": False,
+    "events": 0,
+    "last_event_at": None,
+    "connects": 0,
+    "error": None,
+}
+
+
+def _url() -> str:
+    base = getattr(settings, "OPENSEA_STREAM_URL", "") or "wss://stream.openseabeta.com/socket/websocket"
+    sep = "&" if "?" in base else "?"
+    return f"{base}{sep}token={settings.OPENSEA_API_KEY}&vsn=1.0.0"
+
+
+def _contract_of(item: Dict[str, Any], fallback: Optional[str]) -> Optional[str]:
+    # nft_id is "<chain>/<contract>/<token_id>"
+    parts = str(item.get("nft_id") or "").split("/")
+    return parts[1] if len(parts) >= 3 else fallback
+
+
+def _token_of(item: Dict[str, Any]) -> Optional[str]:
+    parts = str(item.get("nft_id") or "").split("/")
+    return parts[2] if len(parts) >= 3 else None
+
+
+def _native(amount: Any, token: Dict[str, Any]) -> Optional[float]:
+    try:
+        return int(amount) / (10 ** int(token.get("decimals", 18)))
+    except (TypeError, ValueError):
+        return None
+
+
+def _usd(native: float, token: Dict[str, Any]) -> Optional[float]:
+    try:
+        px = float(token.get("usd_price") or 0.0)
+    except (TypeError, ValueError):
+        px = 0.0
+    asset = _PRICED.get(str(token.get("symbol") or "").upper())
+    if not px and asset:
+        from .pricing import price_usd
+
+        px = price_usd(asset)
+    return native * px if px else None
+
+
+def sale_record(payload: Dict[str, Any], contract: str) -> Optional[Dict[str, Any]]:
+    """
+    item_sold payload -> trade record in the shape the trade store and engine
+    read. Only ``price_usd`` carries the price: a sale that cannot be priced
+    in USD adds no volume rather than its wei amount.
+    """
+    tx = payload.get("transaction") or {}
+    token = payload.get("payment_token") or {}
+    native = _native(payload.get("sale_price"), token)
+    if not tx.get("hash") or native is None:
+        return None
+    return {
+        "transaction_hash": tx["hash"],
+        "block_timestamp": tx.get("timestamp") or payload.get("event_timestamp"),
+        "buyer_address": (payload.get("taker") or {}).get("address"),
+        "seller_address": (payload.get("maker") or {}).get("address"),
+        "token_address": contract,
+        "token_ids": [_token_of(payload.get("item") or {})],
+        "price_usd": _usd(native, token),
+        "marketplace": "opensea",
+        "source": "opensea-stream",
+    }
+
+
+def handle(message: Dict[str, Any], topics: Dict[str, str]) -> None:
+    """Apply one channel message to the trade store and the listings mirror."""
+    event = message.get("event")
+    if event not in ("item_sold", "item_listed", "item_cancelled"):
+        return
+    payload = (message.get("payload") or {}).get("payload") or {}
+    contract = _contract_of(payload.get("item") or {}, topics.get(str(message.get("topic"))))
+    if not contract:
+        return
+    _state["events"] += 1
+    _state["last_event_at"] = time.time()
+    order_hash = payload.get("order_hash")
+    if event == "item_sold":
+        record = sale_record(payload, contract)
+        if record:
+            trade_store.ingest(contract, [record], source="stream")
+        if order_hash:
+            listings.book(contract).remove([order_hash])
+    elif event == "item_cancelled":
+        if order_hash:
+            listings.book(contract).remove([order_hash])
+    else:
+        price = _native(payload.get("base_price"), payload.get("payment_token") or {})
+        token_id = _token_of(payload.get("item") or {})
+        if order_hash and price and token_id is not None:
+            order = {"order_hash": order_hash, "chain": (payload.get("item") or {}).get("chain", {}).get("name"),
+                     "protocol_address": payload.get("protocol_address")}
+            expires = coerce_timestamp(payload.get("expiration_date")) or 0.0
+            listings.book(contract).upsert([listings.Listing(order_hash, str(token_id), price, expires, order)])
+
+
+def _set_live(watchlist, live: bool) -> None:
+    for contract in watchlist:
+        trade_store.store(contract).live = live
+
+
+async def _session(watchlist) -> None:
+    import websockets
+
+    topics: Dict[str, str] = {}
+    for contract in watchlist:
+        try:
+            topics[f"collection:{await listings._slug(contract)}"] = contract
+        except Exception as exc:
+            log(f"[STREAM] no collection slug for {contract[:10]}…: {exc}")
+    if not topics:
+        raise RuntimeError("no collections to subscribe to")
+    async with websockets.connect(_url(), ping_interval=None, open_timeout=15) as ws:
+        ref = 0
+        for topic in topics:
+            ref += 1
+            await ws.send(json.dumps({"topic": topic, "event": "phx_join", "payload": {}, "ref": ref}))
+        _state["connected"] = True
+        _state["connects"] += 1
+        _state["error"] = None
+        _set_live(topics.values(), True)
+        # anything that happened while disconnected is only visible to the pollers
+        for contract in topics.values():
+            listings.book(contract).full_synced_at = 0.0
+        listings._feed["wake"].set()
+        log(f"[STREAM] subscribed to {len(topics)} collection(s)")
+
+        async def heartbeat() -> None:
+            nonlocal ref
+            while True:
+                await asyncio.sleep(_HEARTBEAT_SEC)
+                ref += 1
+                await ws.send(json.dumps({"topic": "phoenix", "event": "heartbeat", "payload": {}, "ref": ref}))
+
+        beat = asyncio.ensure_future(heartbeat())
+        try:
+            async for raw in ws:
+                try:
+                    message = json.loads(raw)
+                except ValueError:
+                    continue
+                if isinstance(message, dict):
+                    handle(message, topics)
+        finally:
+            beat.cancel()
+
+
+async def _run() -> None:
+    backoff = 1.0
+    while True:
+        watchlist = [c for c in (contracts() or []) if isinstance(c, str) and c]
+        started = time.time()
+        try:
+            await _session(watchlist)
+            _state["error"] = "closed by server"
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            _state["error"] = str(exc)
+            log(f"[STREAM] disconnected: {exc}")
+        finally:
+            _state["connected"] = False
+            _set_live(watchlist, False)
+        if time.time() - started > 60.0:
+            backoff = 1.0
+        await asyncio.sleep(backoff)
+        backoff = min(60.0, backoff * 2)
+
+
+def start() -> None:
+    """Connect (and keep reconnecting) when OPENSEA_STREAM is on; idempotent."""
+    if not getattr(settings, "OPENSEA_STREAM", False) or not settings.OPENSEA_API_KEY:
+        return
+    future = _state["future"]
+    if future is not None and not future.done():
+        return
+    _state["future"] = asyncio.run_coroutine_threadsafe(_run(), _loop())
+
+
+def stop() -> None:
+    future = _state["future"]
+    _state["future"] = None
+    if future is not None:
+        future.cancel()
+
+
+def status() -> Dict[str, Any]:
+    last = _state["last_event_at"]
+    return {
+        "enabled": bool(getattr(settings, "OPENSEA_STREAM", False)),
+        "connected": _state["connected"],
+        "connects": _state["connects"],
+        "events": _state["events"],
+        "last_event_ago": round(time.time() - last, 1) if last else None,
+        "error": _state["error"],
+    }
@@ -0,0 +1,189 @@
+"""Price sources and bounded per-asset time series with O(1)/O(log n) TWAP and EMA reads."""
+from __future__ import annotations
+
+import bisect
+import json
+import math
+import statistics
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .config import settings
+from .runtime import log
+
+Source = Callable[[], Dict[str, float]]
+
+
+class PriceSeries:
+    """
+    Time series of one asset. Alongside each sample it stores the running
+    time-weighted integral of the (step-wise) price, so a TWAP over any window
+    is two binary searches and a subtraction; the EMA is updated on append.
+    """
+
+    def __init__(self, capacity: int = 2880, half_life_sec: float = 600.0):
+        self._lock = threading.Lock()
+        self._capacity = max(2, int(capacity))
+        self._half_life = max(1.0, float(half_life_sec))
+        self._ts: List[float] = []
+        self._px: List[float] = []
+        self._area: List[float] = []
+        self._head = 0
+        self._ema: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._ts) - self._head
+
+    def append(self, price: float, ts: Optional[float] = None) -> None:
+        ts = time.time() if ts is None else float(ts)
+        with self._lock:
+            if len(self) and ts <= self._ts[-1]:
+                # same-instant update: overwrite the last sample's price
+                self._px[-1] = float(price)
+                return
+            if len(self):
+                prev_ts, prev_px = self._ts[-1], self._px[-1]
+                area = self._area[-1] + prev_px * (ts - prev_ts)
+                alpha = 1.0 - math.exp(-(ts - prev_ts) * math.log(2) / self._half_life)
+                self._ema = self._ema + alpha * (float(price) - self._ema)
+            else:
+                area = 0.0
+                self._ema = float(price)
+            self._ts.append(ts)
+            self._px.append(float(price))
+            self._area.append(area)
+            if len(self) > self._capacity:
+                self._head += 1
+                if self._head >= self._capacity:
+                    # compact lazily so trimming stays amortized O(1)
+                    del self._ts[: self._head], self._px[: self._head], self._area[: self._head]
+                    self._head = 0
+
+    def latest(self) -> Optional[Tuple[float, float]]:
+        with self._lock:
+            return (self._ts[-1], self._px[-1]) if len(self) else None
+
+    def ema(self) -> Optional[float]:
+        return self._ema
+
+    def _integral(self, t: float) -> float:
+        i = bisect.bisect_right(self._ts, t, lo=self._head) - 1
+        if i < self._head:
+            return self._area[self._head]
+        return self._area[i] + self._px[i] * (t - self._ts[i])
+
+    def twap(self, window_sec: float, now: Optional[float] = None) -> Optional[float]:
+        """Time-weighted average over the last ``window_sec`` (clipped to the history held)."""
+        now = time.time() if now is None else now
+        with self._lock:
+            if not len(self):
+                return None
+            start = max(now - float(window_sec), self._ts[self._head])
+            if now <= start:
+                return self._px[-1]
+            return (self._integral(now) - self._integral(start)) / (now - start)
+
+
+# --- sources -----------------------------------------------------------------
+
+# Chainlink USD aggregators per chain: asset -> feed address.
+_CHAINLINK_FEEDS = {
+    "polygon": {
+        "eth": "0xF9680D99D6C9589e2a93a78A04A279e509205945",
+        "polygon": "0xAB594600376Ec9fD91F8e885dADF0CE036862dE0",
+    },
+    "eth": {
+        "eth": "0x5f4eC3Df9cbd43714FE2740f5E3616155c5b8419",
+        "polygon": "0x7bAC85A8a13A4BcD8abb3eB7d6b4d632c5a57676",
+    },
+}
+
+_AGGREGATOR_ABI = [
+    {"inputs": [], "name": "decimals", "outputs": [{"type": "uint8"}], "stateMutability": "view", "type": "function"},
+    {
+        "inputs": [],
+        "name": "latestRoundData",
+        "outputs": [
+            {"name": "roundId", "type": "uint80"},
+            {"name": "answer", "type": "int256"},
+            {"name": "startedAt", "type": "uint256"},
+            {"name": "updatedAt", "type": "uint256"},
+            {"name": "answeredInRound", "type": "uint80"},
+        ],
+        "stateMutability": "view",
+        "type": "function",
+    },
+]
+
+_decimals: Dict[str, int] = {}
+
+
+def _chainlink_feeds() -> Dict[str, str]:
+    raw = getattr(settings, "PRICE_ORACLE_FEEDS", "") or ""
+    try:
+        custom = json.loads(raw) if raw else None
+    except ValueError:
+        custom = None
+    if isinstance(custom, dict) and custom:
+        return {str(k): str(v) for k, v in custom.items()}
+    chain = "eth" if (settings.CHAIN or "").lower() in ("eth", "ethereum") else "polygon"
+    return dict(_CHAINLINK_FEEDS.get(chain, {}))
+
+
+def chainlink_source() -> Dict[str, float]:
+    """Read Chainlink USD aggregators through the RPC pool."""
+    from web3 import Web3
+    from . import rpc_pool
+
+    pool = rpc_pool.pool()
+    if not pool.urls():
+        return {}
+    w3 = pool.web3()
+    max_age = float(getattr(settings, "PRICE_ORACLE_MAX_AGE_SEC", 3 * 3600) or 0)
+    out: Dict[str, float] = {}
+    for asset, address in _chainlink_feeds().items():
+        feed = w3.eth.contract(address=Web3.to_checksum_address(address), abi=_AGGREGATOR_ABI)
+        if address not in _decimals:
+            _decimals[address] = int(feed.functions.decimals().call())
+        _, answer, _, updated_at, _ = feed.functions.latestRoundData().call()
+        if answer <= 0 or (max_age and time.time() - float(updated_at) > max_age):
+            continue
+        out[asset] = float(answer) / (10 ** _decimals[address])
+    return out
+
+
+_sources: Dict[str, Source] = {}
+_last_error_log: Dict[str, float] = {}
+
+
+def register_source(name: str, fn: Source) -> None:
+    """Add a source returning ``{asset: usd_price}``; raising or returning {} skips it."""
+    _sources[name] = fn
+
+
+def sources() -> List[str]:
+    enabled = {s.strip() for s in str(getattr(settings, "PRICE_SOURCES", "") or "").split(",") if s.strip()}
+    return [name for name in _sources if not enabled or name in enabled]
+
+
+def collect() -> Dict[str, Dict[str, float]]:
+    """Query every enabled source; returns ``{asset: {source: price}}``."""
+    quotes: Dict[str, Dict[str, float]] = {}
+    for name in sources():
+        try:
+            result = _sources[name]() or {}
+        except Exception as exc:
+            now = time.time()
+            if now - _last_error_log.get(name, 0.0) >= 300.0:
+                log(f"[PRICE][{name}] error: {exc}")
+                _last_error_log[name] = now
+            continue
+        for asset, px in result.items():
+            if px and px > 0:
+                quotes.setdefault(asset, {})[name] = float(px)
+    return quotes
+
+
+def median(values: Dict[str, float]) -> Optional[float]:
+    return statistics.median(values.values()) if values else None
@@ -1,9 +1,22 @@
-import httpx, time
+import httpx, threading, time
 from http import HTTPStatus
+from typing import Any, Dict, Optional
+from .config import settings
 from .runtime import log
+from .singleflight import flight
+from . import price_oracle
 
 _cache={}; _ts=0.0; _cooldown_until=0.0; _last_rate_limit_log=0.0
 _fallback_prices={"eth": 1800.0, "polygon": 0.65}
+_series={
+    asset: price_oracle.PriceSeries(
+        capacity=int(getattr(settings, "PRICE_HISTORY_SIZE", 2880) or 2880),
+        half_life_sec=float(getattr(settings, "PRICE_EMA_HALF_LIFE_SEC", 600.0) or 600.0),
+    )
+    for asset in ("eth", "polygon")
+}
+_last_quotes: Dict[str, Dict[str, float]] = {}
+_feed={"thread": None, "wake": threading.Event(), "first": threading.Event(), "stop": False}
 
 def _cached_value(key:str)->float:
     value=_cache.get(key)
@@ -14,15 +27,101 @@ def _cached_value(key:str)->float:
     except (TypeError, ValueError):
         return float(_fallback_prices.get(key, 0.0))
 
+def _key(chain:str)->str:
+    return 'eth' if chain in ('eth','ethereum') else 'polygon'
+
+def _interval()->float:
+    return max(5.0, float(getattr(settings, "PRICE_REFRESH_SEC", 30.0) or 30.0))
+
+def _feed_loop()->None:
+    retry_at=0.0; failures=0
+    while not _feed["stop"]:
+        now=time.time()
+        due=max(_ts+_interval(), retry_at)
+        if now>=due:
+            before=_ts
+            flight.do("price:refresh", _refresh)
+            _feed["first"].set()
+            if _ts==before:
+                failures+=1
+                retry_at=time.time()+min(_interval(), 2.0**failures)
+            else:
+                failures=0; retry_at=0.0
+            continue
+        _feed["wake"].wait(due-now)
+        _feed["wake"].clear()
+
+def start_feed()->None:
+    """Start the background refresher (idempotent)."""
+    thread=_feed["thread"]
+    if thread is not None and thread.is_alive():
+        return
+    _feed["stop"]=False
+    thread=threading.Thread(target=_feed_loop, name="price-feed", daemon=True)
+    _feed["thread"]=thread
+    thread.start()
+
+def stop_feed()->None:
+    _feed["stop"]=True
+    _feed["wake"].set()
+
 def price_usd(chain:str)->float:
-    global _cache,_ts,_cooldown_until,_last_rate_limit_log
+    """
+    Latest USD price (median across sources) from the background feed, never
+    blocking on upstream. Only the first call of a process waits briefly.
+    """
+    start_feed()
+    key=_key(chain)
+    if _cache.get(key) is None and not _feed["first"].is_set():
+        _feed["first"].wait(float(getattr(settings, "PRICE_COLD_WAIT_SEC", 2.0) or 0.0))
+    return _cached_value(key)
+
+def twap(chain:str, window_sec:float=3600.0)->Optional[float]:
+    """Time-weighted average of the recorded median price over ``window_sec``."""
+    return _series[_key(chain)].twap(window_sec)
+
+def ema(chain:str)->Optional[float]:
+    """Time-decayed EMA of the recorded median price (PRICE_EMA_HALF_LIFE_SEC)."""
+    return _series[_key(chain)].ema()
+
+def quote(chain:str)->Dict[str, Any]:
+    """Price with its age and per-source quotes; ``stale`` once two refreshes were missed."""
+    start_feed()
+    key=_key(chain)
+    age=(time.time()-_ts) if _ts else None
+    return {
+        "asset": key,
+        "price": _cached_value(key),
+        "source": "median" if _cache.get(key) is not None else "fallback",
+        "sources": dict(_last_quotes.get(key, {})),
+        "twap_1h": twap(key),
+        "ema": ema(key),
+        "age_sec": round(age, 1) if age is not None else None,
+        "stale": age is None or age>2*_interval(),
+        "cooldown_sec": round(max(0.0, _cooldown_until-time.time()), 1),
+    }
+
+def _refresh()->None:
+    """Poll every source once and record the per-asset median."""
+    global _ts
+    quotes=price_oracle.collect()
+    if not quotes:
+        return
     now=time.time()
-    key='eth' if chain in ('eth','ethereum') else 'polygon'
-    cached=_cache.get(key)
-    if cached is not None and now-_ts<30:
-        return float(cached)
-    if cached is not None and now<_cooldown_until:
-        return float(cached)
+    for asset, by_source in quotes.items():
+        px=price_oracle.median(by_source)
+        if not px or asset not in _series:
+            continue
+        _cache[asset]=px
+        _fallback_prices[asset]=px
+        _last_quotes[asset]=by_source
+        _series[asset].append(px, now)
+    _ts=now
+
+def _coingecko()->Dict[str, float]:
+    global _cooldown_until,_last_rate_limit_log
+    if time.time()<_cooldown_until:
+        return {}
     try:
         r=httpx.get(
             'https://api.coingecko.com/api/v3/simple/price',
@@ -31,16 +130,11 @@ def price_usd(chain:str)->float:
             timeout=10,
         )
         r.raise_for_status()
-        data=r.json(); _ts=now
-        eth_px=float(data.get('ethereum',{}).get('usd') or 0.0)
-        matic_px=float(data.get('polygon',{}).get('usd') or 0.0)
-        if eth_px>0:
-            _cache['eth']=eth_px
-        if matic_px>0:
-            _cache['polygon']=matic_px
-        _fallback_prices['eth']=eth_px or _fallback_prices['eth']
-        _fallback_prices['polygon']=matic_px or _fallback_prices['polygon']
-        return _cached_value(key)
+        data=r.json()
+        return {
+            'eth': float(data.get('ethereum',{}).get('usd') or 0.0),
+            'polygon': float(data.get('polygon',{}).get('usd') or 0.0),
+        }
     except httpx.HTTPStatusError as e:
         status=e.response.status_code
         if status==HTTPStatus.TOO_MANY_REQUESTS:
@@ -52,14 +146,15 @@ def price_usd(chain:str)->float:
             now=time.time()
             _cooldown_until=now+max(wait,30.0)
             if now-_last_rate_limit_log>=30.0:
-                log(f"[PRICE] coingecko rate limited (HTTP 429), reusing cached price for {key}.")
+                log("[PRICE] coingecko rate limited (HTTP 429), reusing cached prices.")
                 _last_rate_limit_log=now
-            return _cached_value(key)
+            return {}
         log(f"[PRICE] coingecko error: {e}")
-        return _cached_value(key)
     except httpx.RequestError as e:
         log(f"[PRICE] coingecko request error: {e}")
-        return _cached_value(key)
     except Exception as e:
         log(f"[PRICE] coingecko error: {e}")
-        return _cached_value(key)
+    return {}
+
+price_oracle.register_source("coingecko", _coingecko)
+price_oracle.register_source("chainlink", price_oracle.chainlink_source)
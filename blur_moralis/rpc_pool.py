@@ -0,0 +1,395 @@
+"""Health-scored pool of RPC endpoints with in-call failover and background re-probing."""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+from web3 import Web3
+from web3.middleware import geth_poa_middleware
+from web3.providers.base import BaseProvider
+
+from .config import rpc_urls, settings
+from .runtime import log
+
+Call = Tuple[str, Sequence[Any]]
+
+_EXPECTED_CHAIN_ID = {"eth": 1, "ethereum": 1, "polygon": 137, "matic": 137}
+
+# EWMA weight of the newest observation.
+_ALPHA = 0.3
+
+
+def make_provider(rpc_url: str, timeout: Optional[float] = None) -> BaseProvider:
+    if rpc_url.lower().startswith(("ws://", "wss://")):
+        return Web3.WebsocketProvider(rpc_url, websocket_kwargs={"max_size": 2 ** 25})
+    return Web3.HTTPProvider(rpc_url, request_kwargs={"timeout": timeout or 20})
+
+
+# --- provider registry ---------------------------------------------------------
+# One Web3 (provider, HTTP session, middleware) per URL for the whole process,
+# plus chain ids learned from it. Bounded so ad-hoc /api/rpc_check URLs cannot
+# grow it without limit; configured URLs are dropped only by evict_stale().
+
+_REGISTRY_MAX = 32
+_registry: "OrderedDict[str, Web3]" = OrderedDict()
+_chain_ids: Dict[str, int] = {}
+_registry_lock = threading.Lock()
+
+
+def _timeout() -> float:
+    return float(getattr(settings, "RPC_TIMEOUT_SEC", 6.0) or 6.0)
+
+
+def web3_for(rpc_url: str) -> Web3:
+    """Cached Web3 for ``rpc_url``; created on first use."""
+    with _registry_lock:
+        w3 = _registry.get(rpc_url)
+        if w3 is not None:
+            _registry.move_to_end(rpc_url)
+            return w3
+    w3 = Web3(make_provider(rpc_url, _timeout()))
+    try:
+        w3.middleware_onion.inject(geth_poa_middleware, layer=0)
+    except ValueError:
+        pass
+    with _registry_lock:
+        w3 = _registry.setdefault(rpc_url, w3)
+        keep = set(configured_urls())
+        for url in list(_registry):
+            if len(_registry) <= _REGISTRY_MAX:
+                break
+            if url not in keep and url != rpc_url:
+                _forget(url)
+    return w3
+
+
+def chain_id_for(rpc_url: str) -> int:
+    """Chain id of ``rpc_url``, asked once per provider lifetime."""
+    cid = _chain_ids.get(rpc_url)
+    if cid is None:
+        cid = _chain_ids[rpc_url] = int(web3_for(rpc_url).eth.chain_id)
+    return cid
+
+
+def _forget(rpc_url: str) -> None:
+    _registry.pop(rpc_url, None)
+    _chain_ids.pop(rpc_url, None)
+
+
+def evict_stale() -> List[str]:
+    """Drop providers for URLs no longer in RPC_URL/RPC_URLS and resync the pool."""
+    keep = set(configured_urls())
+    with _registry_lock:
+        stale = [url for url in _registry if url not in keep]
+        for url in stale:
+            _forget(url)
+    pool()
+    return stale
+
+
+# --- JSON-RPC batches -----------------------------------------------------------
+
+_http: Dict[str, Optional[httpx.Client]] = {"client": None}
+
+
+def _http_client() -> httpx.Client:
+    client = _http["client"]
+    if client is None:
+        client = _http["client"] = httpx.Client(
+            timeout=_timeout(),
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=5),
+            headers={"Content-Type": "application/json"},
+        )
+    return client
+
+
+def send_batch(rpc_url: str, provider: BaseProvider, calls: Sequence[Call]) -> List[Dict[str, Any]]:
+    """
+    Send ``calls`` as one JSON-RPC batch and return the responses in call order.
+    Websocket endpoints, and HTTP nodes that refuse batches, get the calls one by one.
+    """
+    if rpc_url.lower().startswith(("http://", "https://")):
+        payload = [{"jsonrpc": "2.0", "id": i, "method": m, "params": list(p)} for i, (m, p) in enumerate(calls)]
+        r = _http_client().post(rpc_url, json=payload)
+        # 400/405/413 and friends: the node refuses batches, not the calls
+        if 400 <= r.status_code < 500 and r.status_code != 429:
+            return [provider.make_request(m, list(p)) for m, p in calls]
+        r.raise_for_status()
+        data = r.json()
+        if isinstance(data, list):
+            by_id = {item.get("id"): item for item in data if isinstance(item, dict)}
+            return [by_id.get(i) or {"error": {"message": "missing from batch reply"}} for i in range(len(calls))]
+    return [provider.make_request(m, list(p)) for m, p in calls]
+
+
+def batch(w3: Web3, calls: Sequence[Call]) -> List[Dict[str, Any]]:
+    """One round trip for ``calls`` on ``w3`` (pool-backed or single provider)."""
+    provider = w3.provider
+    if isinstance(provider, PoolProvider):
+        return provider.pool.batch(calls)
+    return send_batch(str(getattr(provider, "endpoint_uri", "") or ""), provider, calls)
+
+
+class RpcEndpoint:
+    def __init__(self, url: str):
+        self.url = url
+        self.provider = web3_for(url).provider
+        self.latency: Optional[float] = None  # EWMA seconds
+        self.error_rate = 0.0  # EWMA of failures (0..1)
+        self.failures = 0  # consecutive
+        self.demoted_until = 0.0
+        self.chain_id: Optional[int] = _chain_ids.get(url)
+        self.calls = 0
+        self.errors = 0
+
+    def demoted(self, now: float) -> bool:
+        return self.demoted_until > now
+
+    def score(self) -> float:
+        """Lower is better."""
+        latency = self.latency if self.latency is not None else 0.5
+        return latency * (1.0 + 5.0 * self.error_rate)
+
+    def view(self, now: float) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "calls": self.calls,
+            "errors": self.errors,
+            "chain_id": self.chain_id,
+            "demoted_for_sec": round(max(0.0, self.demoted_until - now), 1),
+        }
+
+
+class RpcPool:
+    """
+    Routes each JSON-RPC request to the healthiest endpoint and fails over to
+    the next one inside the same call when a node errors or times out.
+    Endpoints on the wrong chain are never used.
+    """
+
+    def __init__(self, urls: List[str]):
+        self._lock = threading.Lock()
+        self._endpoints: List[RpcEndpoint] = []
+        self._web3: Optional[Web3] = None
+        self._prober: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.set_urls(urls)
+
+    # --- membership ---------------------------------------------------------
+
+    def set_urls(self, urls: List[str]) -> None:
+        wanted = [u for u in dict.fromkeys(urls) if u]
+        with self._lock:
+            current = {ep.url: ep for ep in self._endpoints}
+            self._endpoints = [current.get(u) or RpcEndpoint(u) for u in wanted]
+
+    def urls(self) -> List[str]:
+        with self._lock:
+            return [ep.url for ep in self._endpoints]
+
+    # --- health -------------------------------------------------------------
+
+    def _expected_chain_id(self) -> Optional[int]:
+        return _EXPECTED_CHAIN_ID.get((settings.CHAIN or "").lower())
+
+    def _record(self, ep: RpcEndpoint, elapsed: Optional[float]) -> None:
+        with self._lock:
+            ep.calls += 1
+            if elapsed is None:
+                ep.errors += 1
+                ep.failures += 1
+                ep.error_rate = (1 - _ALPHA) * ep.error_rate + _ALPHA
+                backoff = min(300.0, 5.0 * (2 ** min(ep.failures - 1, 6)))
+                ep.demoted_until = time.time() + backoff
+            else:
+                ep.failures = 0
+                ep.error_rate = (1 - _ALPHA) * ep.error_rate
+                ep.latency = elapsed if ep.latency is None else (1 - _ALPHA) * ep.latency + _ALPHA * elapsed
+                ep.demoted_until = 0.0
+
+    def report(self, ep: RpcEndpoint, elapsed: Optional[float]) -> None:
+        """Feed the outcome of a call made on ``ep.provider`` directly (None = failed)."""
+        self._record(ep, elapsed)
+
+    def _ensure_chain(self, ep: RpcEndpoint) -> bool:
+        expected = self._expected_chain_id()
+        if ep.chain_id is None:
+            resp = ep.provider.make_request("eth_chainId", [])
+            if "result" not in resp:
+                raise RuntimeError(resp.get("error") or "eth_chainId failed")
+            ep.chain_id = int(resp["result"], 16) if isinstance(resp["result"], str) else int(resp["result"])
+            _chain_ids[ep.url] = ep.chain_id
+            if expected and ep.chain_id != expected:
+                log(f"[RPC][WARN] {ep.url} is chainId={ep.chain_id}, expected {expected} — excluded")
+        return not expected or ep.chain_id == expected
+
+    def ranked(self) -> List[RpcEndpoint]:
+        now = time.time()
+        expected = self._expected_chain_id()
+        with self._lock:
+            usable = [ep for ep in self._endpoints if not (expected and ep.chain_id not in (None, expected))]
+        healthy = sorted((ep for ep in usable if not ep.demoted(now)), key=lambda ep: ep.score())
+        demoted = sorted((ep for ep in usable if ep.demoted(now)), key=lambda ep: ep.demoted_until)
+        return healthy + demoted
+
+    def healthy(self) -> List[RpcEndpoint]:
+        """Non-demoted endpoints verified to be on the expected chain, best first."""
+        now = time.time()
+        out = []
+        for ep in self.ranked():
+            if ep.demoted(now):
+                continue
+            try:
+                if self._ensure_chain(ep):
+                    out.append(ep)
+            except Exception:
+                self._record(ep, None)
+        return out
+
+    def probe(self, ep: RpcEndpoint) -> bool:
+        start = time.perf_counter()
+        try:
+            if not self._ensure_chain(ep):
+                return False
+            resp = ep.provider.make_request("eth_blockNumber", [])
+            if "result" not in resp:
+                raise RuntimeError(resp.get("error") or "eth_blockNumber failed")
+        except Exception:
+            self._record(ep, None)
+            return False
+        self._record(ep, time.perf_counter() - start)
+        return True
+
+    def probe_all(self) -> bool:
+        """Probe every endpoint now; True if at least one is usable."""
+        return any([self.probe(ep) for ep in self.ranked()])
+
+    def _probe_loop(self) -> None:
+        # first pass measures every endpoint, later passes only the demoted/unknown ones
+        while not self._stop.is_set():
+            now = time.time()
+            for ep in self.ranked():
+                if ep.demoted(now) or ep.latency is None:
+                    self.probe(ep)
+            self._stop.wait(float(getattr(settings, "RPC_PROBE_SEC", 15.0) or 15.0))
+
+    def start(self) -> None:
+        if self._prober is not None and self._prober.is_alive():
+            return
+        self._stop.clear()
+        self._prober = threading.Thread(target=self._probe_loop, name="rpc-prober", daemon=True)
+        self._prober.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    # --- requests -----------------------------------------------------------
+
+    def request(self, method: str, params: Any) -> Dict[str, Any]:
+        """JSON-RPC request with failover. JSON-RPC error replies are returned, not retried."""
+        last_error: Optional[Exception] = None
+        for ep in self.ranked():
+            start = time.perf_counter()
+            try:
+                if not self._ensure_chain(ep):
+                    continue
+                resp = ep.provider.make_request(method, params)
+            except Exception as exc:
+                last_error = exc
+                self._record(ep, None)
+                log(f"[RPC][FAILOVER] {method} via {ep.url}: {exc}")
+                continue
+            self._record(ep, time.perf_counter() - start)
+            return resp
+        raise ConnectionError(f"all RPC endpoints failed for {method}: {last_error or 'no usable endpoint'}")
+
+    def chain_id(self) -> int:
+        for ep in self.ranked():
+            if ep.chain_id is not None:
+                return ep.chain_id
+        return int(self.web3().eth.chain_id)
+
+    def batch(self, calls: Sequence[Call]) -> List[Dict[str, Any]]:
+        """Like request() but for a whole batch; every reply comes from one node."""
+        last_error: Optional[Exception] = None
+        for ep in self.ranked():
+            start = time.perf_counter()
+            try:
+                if not self._ensure_chain(ep):
+                    continue
+                replies = send_batch(ep.url, ep.provider, calls)
+            except Exception as exc:
+                last_error = exc
+                self._record(ep, None)
+                log(f"[RPC][FAILOVER] batch of {len(calls)} via {ep.url}: {exc}")
+                continue
+            self._record(ep, time.perf_counter() - start)
+            return replies
+        raise ConnectionError(f"all RPC endpoints failed for batch: {last_error or 'no usable endpoint'}")
+
+    def best_url(self) -> Optional[str]:
+        ranked = self.ranked()
+        return ranked[0].url if ranked else None
+
+    def web3(self) -> Web3:
+        """A Web3 whose every request goes through the pool."""
+        if self._web3 is None:
+            w3 = Web3(PoolProvider(self))
+            try:
+                w3.middleware_onion.inject(geth_poa_middleware, layer=0)
+            except ValueError:
+                pass
+            self._web3 = w3
+        return self._web3
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        now = time.time()
+        return [ep.view(now) for ep in self.ranked()]
+
+
+class PoolProvider(BaseProvider):
+    def __init__(self, pool: RpcPool):
+        super().__init__()
+        self.pool = pool
+
+    def make_request(self, method, params):
+        return self.pool.request(method, params)
+
+    def is_connected(self, show_traceback: bool = False) -> bool:
+        return any(self.pool.probe(ep) for ep in self.pool.ranked())
+
+
+_pool: Dict[str, Optional[RpcPool]] = {"pool": None}
+_pool_lock = threading.Lock()
+
+
+def configured_urls() -> List[str]:
+    return [u for u in dict.fromkeys([settings.RPC_URL] + (rpc_urls() or [])) if u]
+
+
+def pool() -> RpcPool:
+    """Process-wide pool over RPC_URL + RPC_URLS, kept in sync with the settings."""
+    urls = configured_urls()
+    with _pool_lock:
+        current = _pool["pool"]
+        if current is None:
+            current = _pool["pool"] = RpcPool(urls)
+            current.start()
+        elif current.urls() != urls:
+            current.set_urls(urls)
+        return current
+
+
+def close() -> None:
+    current = _pool["pool"]
+    if current is not None:
+        current.stop()
+    client = _http["client"]
+    _http["client"] = None
+    if client is not None:
+        client.close()
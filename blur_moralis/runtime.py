@@ -1,9 +1,107 @@
-_logs=[]; _log_seq=0
+import threading
 import time
+from typing import Any, Dict, List, Optional
+
+from .config import settings
+
+
+class LogBuffer:
+    """Fixed-capacity ring of log lines addressed by a monotonic id.
+
+    Ids are contiguous, so the slot of any retained id is computed directly
+    and ``since`` lookups never scan the buffer.
+    """
+
+    def __init__(self, capacity: int):
+        self._lock = threading.Lock()
+        self._capacity = max(1, int(capacity))
+        self._slots: List[Optional[Dict[str, Any]]] = [None] * self._capacity
+        self._last_id = 0
+        self._size = 0
+        self._evicted = 0
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def last_id(self) -> int:
+        return self._last_id
+
+    @property
+    def first_id(self) -> int:
+        """Oldest id still held (``last_id + 1`` when empty)."""
+        return self._last_id - self._size + 1
+
+    @property
+    def evicted(self) -> int:
+        return self._evicted
+
+    def append(self, line: str) -> int:
+        with self._lock:
+            self._last_id += 1
+            if self._size == self._capacity:
+                self._evicted += 1
+            else:
+                self._size += 1
+            self._slots[(self._last_id - 1) % self._capacity] = {"id": self._last_id, "line": line}
+            return self._last_id
+
+    def page(self, since: int = 0, limit: int = 1000) -> Dict[str, Any]:
+        """Up to ``limit`` entries with ``id > since``, oldest first.
+
+        ``next`` is the cursor for the following page; ``dropped`` counts the
+        lines between ``since`` and the oldest retained id that were evicted
+        (always 0 for a first load, ``since=0``).
+        """
+        with self._lock:
+            first = self._last_id - self._size + 1
+            since = max(0, int(since or 0))
+            start = max(since + 1, first)
+            stop = min(self._last_id, start + max(0, int(limit)) - 1)
+            items = [self._slots[(i - 1) % self._capacity] for i in range(start, stop + 1)]
+            return {
+                "logs": items,
+                # a cursor past last_id comes from a previous process; rewind it
+                "next": stop if items else min(since, self._last_id),
+                "more": stop < self._last_id,
+                "dropped": max(0, first - since - 1) if since > 0 else 0,
+                "first_id": first,
+                "last_id": self._last_id,
+                "evicted": self._evicted,
+                "capacity": self._capacity,
+            }
+
+    def resize(self, capacity: int) -> None:
+        """Change capacity, keeping the newest lines that still fit."""
+        capacity = max(1, int(capacity))
+        with self._lock:
+            keep = min(self._size, capacity)
+            first_kept = self._last_id - keep + 1
+            kept = [self._slots[(i - 1) % self._capacity] for i in range(first_kept, self._last_id + 1)]
+            self._evicted += self._size - keep
+            self._size = keep
+            self._capacity = capacity
+            self._slots = [None] * capacity
+            for entry in kept:
+                self._slots[(entry["id"] - 1) % capacity] = entry
+
+
+_buffer = LogBuffer(getattr(settings, "LOG_BUFFER_SIZE", 5000))
+
+
 def log(line:str):
-    global _log_seq; _log_seq+=1
     ts=time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())+'Z'
-    _logs.append({"id":_log_seq,"line":f"[{ts}] {line}"})
-    return _log_seq
+    return _buffer.append(f"[{ts}] {line}")
+
+
 def get_logs(since:int=0,limit:int=1000):
-    return [x for x in _logs if x["id"]>since][-limit:]
+    return _buffer.page(since, limit)["logs"]
+
+
+def logs_page(since:int=0,limit:int=1000)->Dict[str, Any]:
+    return _buffer.page(since, limit)
+
+
+def set_log_capacity(capacity:int)->None:
+    _buffer.resize(capacity)
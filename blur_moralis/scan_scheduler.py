@@ -0,0 +1,157 @@
+"""Per-contract scan scheduling: a heap keyed by next-due time with adaptive intervals."""
+from __future__ import annotations
+
+import heapq
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .config import settings
+
+# Scan outcomes reported back by the engine.
+IDLE, SKIP, SIGNAL = "idle", "skip", "signal"
+
+# Poll at this fraction of the mean gap between trades.
+_GAP_FRACTION = 0.5
+
+
+def _min_interval() -> float:
+    return max(0.2, float(getattr(settings, "ENGINE_SCAN_MIN_SEC", 1.0) or 1.0))
+
+
+def _max_interval() -> float:
+    return max(_min_interval(), float(getattr(settings, "ENGINE_SCAN_MAX_SEC", 60.0) or 60.0))
+
+
+class ScanScheduler:
+    """
+    Contracts come due one by one instead of in fixed rounds. A contract's
+    interval follows its trade rate over the window, doubles after each
+    skipped signal and drops to the minimum after a signal; a fresh on-chain
+    transfer makes the contract due at once (``bump``). ``wake()`` interrupts
+    ``wait()`` immediately.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._heap: List[Tuple[float, str]] = []
+        self._due: Dict[str, float] = {}
+        self._interval: Dict[str, float] = {}
+        self._names: Dict[str, str] = {}  # lower-case address -> watchlist spelling
+        self._event = threading.Event()
+
+    def reset(self) -> None:
+        """Forget every contract (a new engine run starts with all of them due)."""
+        with self._lock:
+            self._heap.clear()
+            self._due.clear()
+            self._interval.clear()
+            self._names.clear()
+
+    def sync(self, watchlist: Iterable[str]) -> None:
+        """Track exactly ``watchlist``; new contracts are due now."""
+        wanted = [c for c in watchlist if isinstance(c, str) and c]
+        now = time.time()
+        with self._lock:
+            for contract in [c for c in self._due if c not in wanted]:
+                del self._due[contract]
+                self._interval.pop(contract, None)
+                self._names.pop(contract.lower(), None)
+            for contract in wanted:
+                if contract not in self._due:
+                    self._due[contract] = now
+                    self._interval[contract] = _min_interval()
+                    self._names[contract.lower()] = contract
+                    heapq.heappush(self._heap, (now, contract))
+
+    def pop_due(self, now: Optional[float] = None) -> List[str]:
+        """Contracts whose turn has come, most overdue first; they leave the heap until rescheduled."""
+        now = now or time.time()
+        out: List[str] = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                due, contract = heapq.heappop(self._heap)
+                if self._due.get(contract) == due:
+                    self._due[contract] = float("inf")
+                    out.append(contract)
+        return out
+
+    def _target(self, contract: str, trades_in_window: int, last_transfer: Optional[float], now: float) -> float:
+        low, high = _min_interval(), _max_interval()
+        if last_transfer is not None and now - last_transfer <= self._interval.get(contract, low):
+            return low
+        if trades_in_window <= 0:
+            return high
+        window = float(int(getattr(settings, "WINDOW_MINUTES", 0) or 0) or 60) * 60.0
+        return min(high, max(low, _GAP_FRACTION * window / trades_in_window))
+
+    def reschedule(
+        self,
+        contract: str,
+        outcome: str,
+        *,
+        trades_in_window: int = 0,
+        last_transfer: Optional[float] = None,
+    ) -> float:
+        """Put a scanned contract back on the heap; returns its new interval."""
+        now = time.time()
+        with self._lock:
+            if contract not in self._due:
+                return 0.0
+            target = self._target(contract, trades_in_window, last_transfer, now)
+            if outcome == SIGNAL:
+                interval = _min_interval()
+            elif outcome == SKIP:
+                interval = min(_max_interval(), max(target, self._interval.get(contract, target) * 2.0))
+            else:
+                interval = target
+            due = now + interval
+            self._interval[contract] = interval
+            self._due[contract] = due
+            heapq.heappush(self._heap, (due, contract))
+        return interval
+
+    def bump(self, contract: str) -> None:
+        """Make ``contract`` due now (activity seen elsewhere) and wake the waiter."""
+        now = time.time()
+        with self._lock:
+            name = self._names.get(contract.lower())
+            due = self._due.get(name) if name else None
+            if due is None or due <= now or due == float("inf"):
+                return  # unknown, already due, or being scanned right now
+            self._due[name] = now
+            heapq.heappush(self._heap, (now, name))
+        self.wake()
+
+    def next_due(self) -> Optional[float]:
+        with self._lock:
+            while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    def wait(self, max_wait: Optional[float] = None) -> bool:
+        """Sleep until the next contract is due or ``wake()``; True when woken."""
+        due = self.next_due()
+        timeout = _max_interval() if due is None else max(0.0, due - time.time())
+        if max_wait is not None:
+            timeout = min(timeout, max_wait)
+        woken = self._event.wait(timeout)
+        self._event.clear()
+        return woken
+
+    def wake(self) -> None:
+        self._event.set()
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            return {
+                contract: {
+                    "interval_sec": round(self._interval.get(contract, 0.0), 2),
+                    "due_in_sec": round(due - now, 1) if due != float("inf") else None,
+                }
+                for contract, due in self._due.items()
+            }
+
+
+scheduler = ScanScheduler()
@@ -1,3 +1,4 @@
+import threading
 import time
 from typing import Optional
 
@@ -28,6 +29,13 @@ stats={"by_strategy":{
     "hybrid":{"wins":0,"losses":0,"avg_edge":0.0},
 }}
 
+_event_seq=0
+_event_lock=threading.Lock()
+
+def event_seq()->int:
+    """Bumped on every register_trade_event call; lets streams detect changes cheaply."""
+    return _event_seq
+
 def kpi():
     out={}
     for k,v in stats["by_strategy"].items():
@@ -51,28 +59,32 @@ def register_trade_event(
     action: Optional[str] = None,
     symbol: Optional[str] = None,
 ):
+    global _event_seq
     now = time.time()
-    risk["last_trade_status"] = status
-    risk["last_trade_ts"] = now
-    if contract is not None:
-        risk["last_trade_contract"] = contract
-    if strategy is not None:
-        risk["last_trade_strategy"] = strategy
-    if size_usd is not None:
-        risk["last_trade_size_usd"] = round(float(size_usd), 4)
-    if size_native is not None:
-        risk["last_trade_size_native"] = round(float(size_native), 6)
-    if pnl_usd is not None:
-        risk["last_trade_pnl_usd"] = round(float(pnl_usd), 4)
-    if pnl_native is not None:
-        risk["last_trade_pnl_native"] = round(float(pnl_native), 6)
-    if note is not None:
-        risk["last_trade_note"] = note
-    if action is not None:
-        risk["last_trade_action"] = action
-    if symbol is not None:
-        risk["last_trade_symbol"] = symbol
-    risk["last_trade_closed"] = status in {"idle", "waiting", "skipped", "win", "loss", "filled", "error"}
+    # scan workers report concurrently; keep the last_trade_* fields consistent
+    with _event_lock:
+        risk["last_trade_status"] = status
+        risk["last_trade_ts"] = now
+        if contract is not None:
+            risk["last_trade_contract"] = contract
+        if strategy is not None:
+            risk["last_trade_strategy"] = strategy
+        if size_usd is not None:
+            risk["last_trade_size_usd"] = round(float(size_usd), 4)
+        if size_native is not None:
+            risk["last_trade_size_native"] = round(float(size_native), 6)
+        if pnl_usd is not None:
+            risk["last_trade_pnl_usd"] = round(float(pnl_usd), 4)
+        if pnl_native is not None:
+            risk["last_trade_pnl_native"] = round(float(pnl_native), 6)
+        if note is not None:
+            risk["last_trade_note"] = note
+        if action is not None:
+            risk["last_trade_action"] = action
+        if symbol is not None:
+            risk["last_trade_symbol"] = symbol
+        risk["last_trade_closed"] = status in {"idle", "waiting", "skipped", "win", "loss", "filled", "error"}
+        _event_seq += 1
 
 def _score(v:dict)->float:
     n=v["wins"]+v["losses"]
@@ -0,0 +1,215 @@
+"""Compact trade records and per-source normalizers compiled from the payload shape."""
+from __future__ import annotations
+
+import sys
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional
+
+
+class Trade(NamedTuple):
+    ts: float  # epoch seconds
+    tx: str  # lower-case tx hash, "" when unknown
+    log_index: Optional[str]
+    buyer: Optional[str]  # lower-case, interned
+    usd: Optional[float]
+    token: Optional[str]
+
+
+def coerce_timestamp(value: Any) -> Optional[float]:
+    """Epoch seconds from seconds/ms/µs numbers, numeric strings or ISO-8601."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        ts = float(value)
+        while ts > 1e12:
+            ts /= 1000.0
+        if ts > 1e10:
+            ts /= 1000.0
+        return ts
+    if isinstance(value, str):
+        txt = value.strip()
+        if not txt:
+            return None
+        try:
+            return coerce_timestamp(float(txt))
+        except (TypeError, ValueError):
+            pass
+        try:
+            if txt.endswith("Z"):
+                txt = txt[:-1] + "+00:00"
+            return datetime.fromisoformat(txt).timestamp()
+        except ValueError:
+            return None
+    return None
+
+
+_TS_KEYS = ("ts", "block_timestamp", "blockTimestamp", "timestamp", "time", "created_at", "createdAt",
+            "event_timestamp")
+_TX_KEYS = ("tx", "transaction_hash", "transactionHash", "tx_hash")
+_LOG_INDEX_KEYS = ("log_index", "logIndex")
+_TOKEN_KEYS = ("token", "token_ids", "tokenIds", "token_id")
+_USD_KEYS = ("usd", "price_usd", "usd_price", "usdPrice", "priceUsd", "sale_price_usd", "total_price_usd",
+             "value_usd", "valueUsd")
+_BUYER_KEYS = ("buyer", "buyer_address", "buyerAddress", "to_address", "toAddress", "to", "winner_address",
+               "winnerAddress")
+
+
+def _positive(value: Any) -> Optional[float]:
+    if value is None:
+        return None
+    try:
+        num = float(value)
+    except (TypeError, ValueError):
+        return None
+    return num if num >= 0 else None
+
+
+def _usd_any(trade: Dict[str, Any]) -> Optional[float]:
+    """Every USD convention the feeds have used, in order of preference."""
+    for key in _USD_KEYS:
+        if key in trade:
+            usd = _positive(trade.get(key))
+            if usd is not None:
+                return usd
+    native = trade.get("native_price") or trade.get("nativePrice")
+    if isinstance(native, dict):
+        usd = _positive(native.get("usd") or native.get("usd_price") or native.get("usdPrice"))
+        if usd is not None:
+            return usd
+        amount = _positive(native.get("value") or native.get("amount"))
+        if amount is not None and native.get("decimals") is not None:
+            try:
+                return amount / (10 ** int(native["decimals"]))
+            except (TypeError, ValueError):
+                pass
+    token = trade.get("payment_token") or trade.get("paymentToken")
+    if isinstance(token, dict):
+        usd_price = _positive(token.get("usd_price") or token.get("usdPrice"))
+        amount = _positive(trade.get("total_price") or trade.get("price"))
+        if amount is not None and usd_price is not None:
+            try:
+                if token.get("decimals") is not None:
+                    amount /= 10 ** int(token["decimals"])
+            except (TypeError, ValueError):
+                pass
+            return amount * usd_price
+    return _positive(trade.get("price") or trade.get("total_price"))
+
+
+def _buyer_any(trade: Dict[str, Any]) -> Optional[str]:
+    for key in _BUYER_KEYS:
+        value = trade.get(key)
+        if isinstance(value, str) and value.strip():
+            return value
+    buyer = trade.get("buyer") or trade.get("to_account") or trade.get("toAccount")
+    if isinstance(buyer, dict):
+        for field in ("address", "wallet_address", "walletAddress"):
+            value = buyer.get(field)
+            if isinstance(value, str) and value.strip():
+                return value
+    return None
+
+
+def _ts_parser(sample: Any) -> Callable[[Any], Optional[float]]:
+    """A converter specialised to the sample's encoding (unit scale or ISO form)."""
+    if isinstance(sample, str):
+        try:
+            float(sample)
+        except ValueError:
+            if sample.endswith("Z"):
+                return lambda v: datetime.fromisoformat(v[:-1] + "+00:00").timestamp()
+            return lambda v: datetime.fromisoformat(v).timestamp()
+    ts = coerce_timestamp(sample)
+    if ts is None or not ts:
+        return coerce_timestamp
+    scale = float(sample) / ts
+    if scale == 1.0:
+        return float
+    return lambda v: float(v) / scale
+
+
+def _first(sample: Dict[str, Any], keys) -> Optional[str]:
+    return next((k for k in keys if sample.get(k) not in (None, "")), None)
+
+
+class _Plan:
+    """Field lookups resolved once for one payload shape."""
+
+    __slots__ = ("ts_key", "ts", "tx_key", "idx_key", "token_key", "buyer", "usd")
+
+    def __init__(self, sample: Dict[str, Any]):
+        self.ts_key = _first(sample, _TS_KEYS) or "ts"
+        self.ts = _ts_parser(sample.get(self.ts_key))
+        self.tx_key = _first(sample, _TX_KEYS)
+        self.idx_key = next((k for k in _LOG_INDEX_KEYS if k in sample), None)
+        self.token_key = _first(sample, _TOKEN_KEYS)
+        buyer_key = next((k for k in _BUYER_KEYS if isinstance(sample.get(k), str) and sample[k].strip()), None)
+        self.buyer = (lambda t: t.get(buyer_key) or _buyer_any(t)) if buyer_key else _buyer_any
+        usd_key = next((k for k in _USD_KEYS if _positive(sample.get(k)) is not None), None)
+        self.usd = (lambda t: _positive(t.get(usd_key)) or _usd_any(t)) if usd_key else _usd_any
+
+    def __call__(self, raw: Dict[str, Any]) -> Optional[Trade]:
+        value = raw.get(self.ts_key)
+        try:
+            ts = self.ts(value)
+        except (TypeError, ValueError, AttributeError):
+            ts = None
+        if ts is None or not 1e9 < ts < 1e10:
+            # another unit or encoding than the plan's sample (ms after seconds, ...)
+            ts = coerce_timestamp(value)
+        if ts is None:
+            return None
+        tx = raw.get(self.tx_key) if self.tx_key else None
+        idx = raw.get(self.idx_key) if self.idx_key else None
+        token = raw.get(self.token_key) if self.token_key else None
+        if isinstance(token, (list, tuple)):
+            token = ",".join(str(t) for t in token)
+        buyer = self.buyer(raw)
+        return Trade(
+            ts,
+            str(tx).lower() if tx else "",
+            str(idx) if idx is not None else None,
+            sys.intern(buyer.strip().lower()) if isinstance(buyer, str) else None,
+            self.usd(raw),
+            str(token) if token not in (None, "") else None,
+        )
+
+
+class Normalizer:
+    """
+    Raw trade dicts of one source -> Trade. The plan is compiled from the first
+    payload and rebuilt when a payload no longer carries its timestamp key
+    (another endpoint version, or old cache rows).
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        self._plan: Optional[_Plan] = None
+
+    def __call__(self, raw: Any) -> Optional[Trade]:
+        if isinstance(raw, Trade):
+            return raw
+        if not isinstance(raw, dict):
+            return None
+        plan = self._plan
+        if plan is None or plan.ts_key not in raw:
+            plan = self._plan = _Plan(raw)
+        return plan(raw)
+
+
+_normalizers: Dict[str, Normalizer] = {}
+_normalizers_lock = threading.Lock()
+
+
+def normalizer(source: str) -> Normalizer:
+    with _normalizers_lock:
+        found = _normalizers.get(source)
+        if found is None:
+            found = _normalizers[source] = Normalizer(source)
+        return found
+
+
+def normalize(trades: Iterable[Any], source: str) -> List[Trade]:
+    convert = normalizer(source)
+    return [t for t in map(convert, trades) if t is not None]
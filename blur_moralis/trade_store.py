@@ -0,0 +1,399 @@
+"""Incremental, cursor-based trade ingestion into bounded per-contract stores."""
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+from .config import settings
+from .cu_budget import PRIORITY_HOT, PRIORITY_TRADES
+from .moralis_api import _allow, _chain_param, _charge
+from .moralis_async import run_sync, trades_page_async
+from . import moralis_cache
+from .runtime import log
+from .trade_record import Trade, normalize
+
+_TradeKey = Tuple[str, str]
+_Entry = Tuple[float, _TradeKey, Trade]
+
+
+def trade_key(trade: Trade) -> _TradeKey:
+    """(tx hash, log index) identity of a sale, with a best-effort fallback."""
+    if trade.tx and trade.log_index is not None:
+        return trade.tx, trade.log_index
+    return trade.tx, f"{trade.token}@{trade.ts}"
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _window_sec() -> float:
+    minutes = int(getattr(settings, "TRADE_STORE_WINDOW_MINUTES", 0) or 0)
+    if minutes <= 0:
+        minutes = int(getattr(settings, "WINDOW_MINUTES", 0) or 0) or 60
+    return float(minutes) * 60.0
+
+
+class WindowStats:
+    """
+    Running count, buyer multiset and USD volume over the trailing window.
+    Trades enter as they are stored and leave from the old end as time
+    passes, so a liquidity check costs O(expired) instead of a full scan.
+    """
+
+    def __init__(self, window_sec: float):
+        self.window_sec = window_sec
+        self._items: Deque[Tuple[float, Optional[str], float]] = deque()
+        self._buyers: Counter = Counter()
+        self.volume = 0.0
+        self._unsorted = False
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @property
+    def buyers(self) -> int:
+        return len(self._buyers)
+
+    def add(self, trade: Trade, now: float) -> None:
+        if trade.ts < now - self.window_sec:
+            return
+        item = (trade.ts, trade.buyer, max(0.0, trade.usd or 0.0))
+        if self._items and item[0] < self._items[-1][0]:
+            self._unsorted = True  # late arrival from a backfill page
+        self._items.append(item)
+        if item[1]:
+            self._buyers[item[1]] += 1
+        self.volume += item[2]
+
+    def _sort(self) -> None:
+        if self._unsorted:
+            self._items = deque(sorted(self._items, key=lambda it: it[0]))
+            self._unsorted = False
+
+    def _drop(self, item: Tuple[float, Optional[str], float]) -> None:
+        _, buyer, usd = item
+        if buyer:
+            self._buyers[buyer] -= 1
+            if self._buyers[buyer] <= 0:
+                del self._buyers[buyer]
+        self.volume -= usd
+
+    def expire(self, before: float) -> None:
+        self._sort()
+        items = self._items
+        while items and items[0][0] < before:
+            self._drop(items.popleft())
+        if not items:
+            self.volume = 0.0  # shed float drift
+
+    def evict(self, trades: List[Trade]) -> None:
+        """Take out ``trades`` (oldest first) that the store dropped before they expired."""
+        if not trades:
+            return
+        self._sort()
+        gone = Counter((t.ts, t.buyer, max(0.0, t.usd or 0.0)) for t in trades)
+        last = trades[-1].ts
+        items = self._items
+        kept = []  # same-timestamp neighbours the store still holds
+        while items and items[0][0] <= last:
+            item = items.popleft()
+            if gone[item] > 0:
+                gone[item] -= 1
+                self._drop(item)
+            else:
+                kept.append(item)
+        items.extendleft(reversed(kept))
+        if not items:
+            self.volume = 0.0
+
+
+class TradeStore:
+    """
+    Time-ordered trades of one contract, deduplicated by (tx hash, log index).
+    Records without a log index (push feeds) are matched by (tx hash, token)
+    against every source, so one sale is counted once and each item of a
+    sweep still counts on its own.
+    """
+
+    def __init__(self, contract: str):
+        self.contract = contract
+        self._lock = threading.Lock()
+        self._items: Deque[_Entry] = deque()
+        self._keys: set = set()
+        # (tx, token) -> [indexed, unindexed] stored records
+        self._pairs: Dict[Tuple[str, str], List[int]] = {}
+        self.newest_ts: Optional[float] = None
+        self.newest_key: Optional[_TradeKey] = None
+        # Pending older-page walk: (cursor, from_date, to_date) of the query it belongs to.
+        self.backfill: Optional[Tuple[Optional[str], Optional[str], Optional[str]]] = None
+        # Forward walks cut short by the page budget: (cursor, from_date) of each,
+        # still owed the trades between the pages read and the previous newest.
+        self.gaps: List[Tuple[str, Optional[str]]] = []
+        self.synced_at: Optional[float] = None
+        # Set while a push source (OpenSea stream) delivers this contract's sales.
+        self.live = False
+        self._stats: Optional[WindowStats] = None
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @property
+    def oldest_ts(self) -> Optional[float]:
+        with self._lock:
+            return self._items[0][0] if self._items else None
+
+    def add(self, trades: Iterable[Any], *, source: str = "moralis") -> List[_Entry]:
+        """Normalize and insert unseen trades; returns the ``(ts, key, trade)`` entries that were new."""
+        records = normalize(trades, source)
+        added: List[_Entry] = []
+        with self._lock:
+            items = self._items
+            resort = False
+            for trade in records:
+                ts = trade.ts
+                key = trade_key(trade)
+                if key in self._keys:
+                    continue
+                unindexed = trade.log_index is None
+                if trade.tx:
+                    counts = self._pairs.get((trade.tx, trade.token or ""))
+                    if counts and (counts[1] or (unindexed and counts[0])):
+                        continue
+                    if counts is None:
+                        counts = self._pairs[(trade.tx, trade.token or "")] = [0, 0]
+                    counts[1 if unindexed else 0] += 1
+                self._keys.add(key)
+                entry = (ts, key, trade)
+                added.append(entry)
+                if not items or ts >= items[-1][0]:
+                    items.append(entry)
+                elif ts <= items[0][0]:
+                    items.appendleft(entry)
+                else:
+                    items.append(entry)
+                    resort = True
+            if resort:
+                self._items = items = deque(sorted(items, key=lambda it: it[0]))
+            if self._stats is not None:
+                now = time.time()
+                for _, _, trade in added:
+                    self._stats.add(trade, now)
+            if items:
+                self.newest_ts, self.newest_key = items[-1][0], items[-1][1]
+        return added
+
+    def prune(self, *, now: Optional[float] = None, window_sec: Optional[float] = None) -> int:
+        """Drop trades older than the window and beyond the per-contract cap."""
+        cutoff = (now or time.time()) - (window_sec if window_sec is not None else _window_sec())
+        cap = max(1, int(getattr(settings, "TRADE_STORE_MAX_PER_CONTRACT", 5000) or 5000))
+        dropped = 0
+        capped: List[Trade] = []
+        with self._lock:
+            items = self._items
+            while items and (items[0][0] < cutoff or len(items) > cap):
+                _, key, trade = items.popleft()
+                if trade.ts >= cutoff:
+                    capped.append(trade)
+                self._keys.discard(key)
+                pair = (trade.tx, trade.token or "")
+                counts = self._pairs.get(pair)
+                if counts is not None:
+                    counts[1 if trade.log_index is None else 0] -= 1
+                    if not any(counts):
+                        del self._pairs[pair]
+                dropped += 1
+            if capped and self._stats is not None:
+                # the cap evicted trades still inside the liquidity window
+                self._stats.evict(capped)
+        return dropped
+
+    def window_stats(self, window_sec: float, now: Optional[float] = None) -> Tuple[int, int, float]:
+        """(trades, distinct buyers, USD volume) over the last ``window_sec``."""
+        now = now or time.time()
+        with self._lock:
+            stats = self._stats
+            if stats is None or stats.window_sec != window_sec:
+                stats = self._stats = WindowStats(window_sec)
+                for _, _, trade in self._items:
+                    stats.add(trade, now)
+            stats.expire(now - window_sec)
+            return len(stats), stats.buyers, stats.volume
+
+    def covers(self, since: float) -> bool:
+        """True when no older page is pending for a window starting at ``since``."""
+        oldest = self.oldest_ts
+        return self.backfill is None or (oldest is not None and oldest <= since)
+
+    def trades(self, since: Optional[float] = None) -> List[Trade]:
+        """Stored trades newest first (the Moralis page order), optionally ``ts >= since``."""
+        with self._lock:
+            out = []
+            for ts, _, trade in reversed(self._items):
+                if since is not None and ts < since:
+                    break
+                out.append(trade)
+            return out
+
+
+_stores: Dict[str, TradeStore] = {}
+_stores_lock = threading.Lock()
+
+
+def store(contract: str) -> TradeStore:
+    chain = _chain_param()
+    key = f"{contract.lower()}:{chain}"
+    with _stores_lock:
+        found = _stores.get(key)
+        if found is None:
+            found = _stores[key] = TradeStore(contract)
+            since = time.time() - _window_sec()
+            warm = moralis_cache.load_trades(chain, contract, since)
+            if warm:
+                found.add(warm, source="cache")
+                oldest = found.oldest_ts
+                if oldest is not None and oldest > since + 60.0:
+                    # the cache starts inside the window: fetch what lies before it
+                    found.backfill = (None, _iso(since), _iso(oldest))
+                log(
+                    f"[TRADES] {contract[:8]}… warm start: {len(found)} trades from cache"
+                    + (" backfill pending" if found.backfill else "")
+                )
+        return found
+
+
+async def sync_contract(contract: str) -> TradeStore:
+    """
+    One ingestion round for ``contract``, gated like recent_trades (contracts
+    with trades in the window get hot priority on the CU budget). Walks new
+    pages from the newest stored trade until it reaches known trades, then
+    closes forward gaps left by earlier rounds and continues the pending
+    backfill toward the start of the window.
+    """
+    st = store(contract)
+    if st.live and st.newest_ts is not None and st.backfill is None and not st.gaps:
+        return st  # the push feed keeps it current
+    priority = PRIORITY_HOT if len(st) else PRIORITY_TRADES
+    gate_key = f"trades:{contract}:{_chain_param()}"
+    if not _allow(gate_key, priority=priority):
+        return st
+    now = time.time()
+    window = _window_sec()
+    page_size = max(1, min(100, int(getattr(settings, "MORALIS_TRADES_PAGE_SIZE", 100) or 100)))
+    max_pages = max(1, int(getattr(settings, "MORALIS_TRADES_MAX_PAGES", 3) or 3))
+    pages = 0
+
+    async def fetch(cursor: Optional[str], from_date: Optional[str], to_date: Optional[str] = None):
+        # _allow paid for the first page; every further page is charged on its own
+        nonlocal pages
+        if pages and not _charge(gate_key, priority=priority):
+            return None
+        pages += 1
+        return await trades_page_async(contract, limit=page_size, cursor=cursor, from_date=from_date, to_date=to_date)
+
+    first_sync = st.newest_ts is None
+    from_date = _iso(now - window) if first_sync else _iso(max(st.newest_ts, now - window))
+    cursor: Optional[str] = None
+    added: List[_Entry] = []
+    while pages < max_pages:
+        page = await fetch(cursor, from_date)
+        if page is None:
+            break
+        items, cursor = page
+        fresh = st.add(items)
+        added.extend(fresh)
+        if not cursor:
+            break
+        if not first_sync and len(fresh) < len(items):
+            cursor = None  # reached trades we already hold
+            break
+    if first_sync:
+        st.backfill = (cursor, from_date, None) if cursor else None
+    elif cursor:
+        # newest_ts already moved past the unread pages; resume them from their cursor
+        st.gaps.append((cursor, from_date))
+
+    while st.gaps and pages < max_pages:
+        gap_cursor, gap_from = st.gaps[0]
+        page = await fetch(gap_cursor, gap_from)
+        if page is None:
+            break
+        items, next_cursor = page
+        fresh = st.add(items)
+        added.extend(fresh)
+        if next_cursor and len(fresh) == len(items):
+            st.gaps[0] = (next_cursor, gap_from)
+        else:
+            st.gaps.pop(0)
+
+    while st.backfill is not None and pages < max_pages and not st.covers(now - window):
+        back_cursor, back_from, back_to = st.backfill
+        page = await fetch(back_cursor, back_from, back_to)
+        if page is None:
+            break
+        items, next_cursor = page
+        added.extend(st.add(items))
+        st.backfill = (next_cursor, back_from, back_to) if next_cursor else None
+
+    dropped = st.prune(now=now, window_sec=window)
+    st.synced_at = now
+    if added or dropped:
+        moralis_cache.save_trades(_chain_param(), contract, _rows(added), prune_before=now - window)
+        log(
+            f"[TRADES] {contract[:8]}… +{len(added)} store={len(st)} pages={pages}"
+            + (f" pruned={dropped}" if dropped else "")
+            + (" backfill pending" if st.backfill else "")
+            + (f" gaps={len(st.gaps)}" if st.gaps else "")
+        )
+    return st
+
+
+def _rows(entries: List[_Entry]) -> List[Tuple[float, _TradeKey, Dict[str, Any]]]:
+    return [(ts, key, trade._asdict()) for ts, key, trade in entries]
+
+
+def ingest(contract: str, trades: Iterable[Dict[str, Any]], *, source: str = "push") -> int:
+    """Add trades from a non-Moralis source (stream, chain logs); returns how many were new."""
+    st = store(contract)
+    added = st.add(trades, source=source)
+    if added:
+        now = time.time()
+        st.prune(now=now)
+        moralis_cache.save_trades(_chain_param(), contract, _rows(added), prune_before=now - _window_sec())
+        log(f"[TRADES] {contract[:8]}… +{len(added)} from {source} store={len(st)}")
+    return len(added)
+
+
+async def sync_many(contracts: Iterable[str]) -> Dict[str, List[Trade]]:
+    """Sync every contract concurrently; returns window trades per contract."""
+    unique = [c for c in dict.fromkeys(contracts) if isinstance(c, str) and c]
+    bound = int(getattr(settings, "MORALIS_CONCURRENCY", 8) or 8)
+    gate = asyncio.Semaphore(max(1, bound))
+
+    async def one(contract: str) -> None:
+        async with gate:
+            await sync_contract(contract)
+
+    results = await asyncio.gather(*(one(c) for c in unique), return_exceptions=True)
+    since = time.time() - _window_sec()
+    out: Dict[str, List[Trade]] = {}
+    for contract, result in zip(unique, results):
+        if isinstance(result, BaseException):
+            log(f"[TRADES][ERR] {contract[:8]}…: {result}")
+        out[contract] = store(contract).trades(since)
+    return out
+
+
+def window_trades(contracts: Iterable[str], *, timeout: float = 90.0) -> Dict[str, List[Trade]]:
+    """Blocking bridge for the engine thread."""
+    contracts = list(contracts)
+    try:
+        return run_sync(sync_many(contracts), timeout=timeout)
+    except Exception as exc:
+        log(f"[TRADES][ERR] sync: {exc}")
+        since = time.time() - _window_sec()
+        return {c: store(c).trades(since) for c in contracts if isinstance(c, str) and c}
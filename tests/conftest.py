@@ -0,0 +1,14 @@
+import pytest
+
+from blur_moralis import listings, trade_store
+from blur_moralis.config import settings
+
+
+@pytest.fixture(autouse=True)
+def isolated_stores(monkeypatch):
+    """Fresh trade stores and listing books, no sqlite cache."""
+    monkeypatch.setattr(settings, "MORALIS_CACHE_PATH", "")
+    monkeypatch.setattr(trade_store, "_stores", {})
+    monkeypatch.setattr(listings, "_books", {})
+    monkeypatch.setattr(listings, "start_feed", lambda: None)
+    yield
@@ -0,0 +1,128 @@
+import asyncio
+import json
+import time
+
+import pytest
+import websockets
+
+from blur_moralis import chain_events, pricing, trade_store
+from blur_moralis.config import settings
+from blur_moralis.moralis_async import run_sync
+
+CONTRACT = "0xbc4ca0eda7647a8ab7c2061c2e118a18a936f13d"
+TX = "0x" + "cd" * 32
+BLOCK = 19_000_000
+BLOCK_TS = 1_705_000_000
+
+# OrderFulfilled of a listing fill: token 4321 sold for 1.94 ETH + 0.05 ETH fee.
+FILL_LOG = {
+    "address": chain_events.SEAPORT_ADDRESSES[0],
+    "topics": [
+        chain_events.ORDER_FULFILLED_TOPIC,
+        "0x0000000000000000000000002222222222222222222222222222222222222222",
+        "0x000000000000000000000000004c00500000ad104d7dbd00e3ae0a5c00560c00",
+    ],
+    "data": "0x" + (
+    "5f5f5f5f5f5f5f5f5f5f5f5f5f5f5f5f5f5f5f5f5f5f5f5f5f5f5f5f5f5f5f5f00000000000000000000000011111111"
+    "111111111111111111111111111111110000000000000000000000000000000000000000000000000000000000000080"
+    "000000000000000000000000000000000000000000000000000000000000012000000000000000000000000000000000"
+    "000000000000000000000000000000010000000000000000000000000000000000000000000000000000000000000002"
+    "000000000000000000000000bc4ca0eda7647a8ab7c2061c2e118a18a936f13d00000000000000000000000000000000"
+    "000000000000000000000000000010e10000000000000000000000000000000000000000000000000000000000000001"
+    "000000000000000000000000000000000000000000000000000000000000000200000000000000000000000000000000"
+    "000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000"
+    "000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000"
+    "00000000000000001aec43b8b04200000000000000000000000000002222222222222222222222222222222222222222"
+    "000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000"
+    "000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000"
+    "00000000000000000000000000000000000000000000000000b1a2bc2ec500000000000000000000000000000000a26b"
+    "00c1f0df003000390027140000faa719"
+    ),
+    "blockNumber": hex(BLOCK),
+    "transactionHash": TX,
+    "logIndex": hex(187),
+    "removed": False,
+}
+
+
+@pytest.fixture(autouse=True)
+def eth_price(monkeypatch):
+    monkeypatch.setattr(settings, "CHAIN", "eth")
+    monkeypatch.setattr(pricing, "price_usd", lambda asset: 2000.0)
+
+
+def test_decode_fill_listing():
+    (record,) = chain_events.decode_fill(FILL_LOG, [CONTRACT], BLOCK_TS)
+    assert record["token_address"].lower() == CONTRACT
+    assert record["token_ids"] == ["4321"]
+    assert record["seller_address"] == "0x2222222222222222222222222222222222222222"
+    assert record["buyer_address"] == "0x1111111111111111111111111111111111111111"
+    assert "price" not in record
+    assert record["price_usd"] == pytest.approx(3980.0)
+    assert record["block_timestamp"] == BLOCK_TS
+    assert "log_index" not in record
+
+
+def test_unpriced_fill_adds_no_volume(monkeypatch):
+    monkeypatch.setattr(pricing, "price_usd", lambda asset: 0.0)
+    trade_store.ingest(CONTRACT, chain_events.decode_fill(FILL_LOG, [CONTRACT], time.time() - 30), source="chain")
+    assert trade_store.store(CONTRACT).window_stats(3600.0) == (1, 1, 0.0)
+
+
+def test_decode_fill_ignores_unwatched_contract():
+    assert chain_events.decode_fill(FILL_LOG, ["0x" + "00" * 20], BLOCK_TS) == []
+
+
+def test_chain_record_and_moralis_row_are_one_trade():
+    records = chain_events.decode_fill(FILL_LOG, [CONTRACT], time.time() - 30)
+    trade_store.ingest(CONTRACT, records, source="chain")
+    st = trade_store.store(CONTRACT)
+    st.add([{
+        "transaction_hash": TX,
+        "log_index": 187,
+        "block_timestamp": time.time() - 30,
+        "buyer_address": "0x1111111111111111111111111111111111111111",
+        "token_ids": ["4321"],
+        "price_usd": 3980.0,
+    }])
+    assert len(st) == 1
+    count, buyers, volume = st.window_stats(3600.0)
+    assert (count, buyers) == (1, 1)
+    assert volume == pytest.approx(3980.0)
+
+
+def test_subscription_stand_in(monkeypatch):
+    """A local node: acknowledges the three eth_subscribe calls, pushes a head then a fill."""
+    requests = []
+
+    async def node(ws):
+        for _ in range(3):
+            request = json.loads(await ws.recv())
+            requests.append(request["params"][0])
+            await ws.send(json.dumps({"jsonrpc": "2.0", "id": request["id"], "result": f"0xsub{request['id']}"}))
+        head = {"number": hex(BLOCK), "timestamp": hex(BLOCK_TS)}
+        await ws.send(json.dumps({"method": "eth_subscription", "params": {"subscription": "0xsub3", "result": head}}))
+        await ws.send(json.dumps({"method": "eth_subscription", "params": {"subscription": "0xsub1", "result": FILL_LOG}}))
+        await asyncio.sleep(0.5)
+
+    async def start():
+        return await websockets.serve(node, "127.0.0.1", 0)
+
+    server = run_sync(start(), timeout=5)
+    port = server.sockets[0].getsockname()[1]
+    monkeypatch.setattr(settings, "RPC_WS_URL", f"ws://127.0.0.1:{port}")
+    monkeypatch.setattr(settings, "TRADE_STORE_WINDOW_MINUTES", 10 ** 8)
+    monkeypatch.setattr(chain_events, "contracts", lambda: [CONTRACT])
+    try:
+        chain_events.start()
+        deadline = time.time() + 5
+        while time.time() < deadline and not len(trade_store.store(CONTRACT)):
+            time.sleep(0.05)
+    finally:
+        chain_events.stop()
+        server.close()
+        run_sync(server.wait_closed(), timeout=5)
+    assert requests == ["logs", "logs", "newHeads"]
+    (trade,) = trade_store.store(CONTRACT).trades()
+    assert (trade.tx, trade.token, trade.ts) == (TX, "4321", BLOCK_TS)
+    assert chain_events.status()["head"] == BLOCK
@@ -0,0 +1,124 @@
+import asyncio
+import json
+import time
+
+import pytest
+import websockets
+
+from blur_moralis import listings, opensea_stream, trade_store
+from blur_moralis.config import settings
+from blur_moralis.moralis_async import _loop, run_sync
+
+CONTRACT = "0xbc4ca0eda7647a8ab7c2061c2e118a18a936f13d"
+TX = "0x" + "ab" * 32
+
+
+def _sold(token_id, order_hash):
+    return {
+        "event": "item_sold",
+        "topic": "collection:apes",
+        "payload": {"payload": {
+            "item": {"nft_id": f"ethereum/{CONTRACT}/{token_id}"},
+            "order_hash": order_hash,
+            "sale_price": "1500000000000000000",
+            "payment_token": {"decimals": 18, "usd_price": "2000"},
+            "transaction": {"hash": TX, "timestamp": time.time() - 5},
+            "taker": {"address": "0xBuyer"},
+            "maker": {"address": "0xSeller"},
+        }},
+    }
+
+
+def _moralis_row(token_id, log_index):
+    return {
+        "transaction_hash": TX,
+        "log_index": log_index,
+        "block_timestamp": time.time() - 5,
+        "buyer_address": "0xbuyer",
+        "token_ids": [str(token_id)],
+        "price_usd": 3000.0,
+    }
+
+
+def test_sweep_from_stream_then_moralis_counts_each_item_once():
+    for n, token_id in enumerate((1, 2, 3)):
+        opensea_stream.handle(_sold(token_id, f"0xorder{n}"), {"collection:apes": CONTRACT})
+    st = trade_store.store(CONTRACT)
+    assert len(st) == 3
+    st.add([_moralis_row(token_id, 10 + n) for n, token_id in enumerate((1, 2, 3))])
+    assert len(st) == 3
+    assert st.window_stats(3600.0)[:2] == (3, 1)
+
+
+def test_sale_without_usd_price_is_priced_in_usd_not_wei(monkeypatch):
+    from blur_moralis import pricing
+
+    monkeypatch.setattr(pricing, "price_usd", lambda asset: 2000.0 if asset == "eth" else 0.0)
+    priced = _sold(1, "0xorder")
+    priced["payload"]["payload"]["payment_token"] = {"decimals": 18, "symbol": "ETH"}
+    unpriced = _sold(2, "0xother")
+    unpriced["payload"]["payload"]["payment_token"] = {"decimals": 6, "symbol": "USDC"}
+    for message in (priced, unpriced):
+        opensea_stream.handle(message, {"collection:apes": CONTRACT})
+    count, _, volume = trade_store.store(CONTRACT).window_stats(3600.0)
+    assert count == 2
+    assert volume == pytest.approx(3000.0)
+
+
+def test_listed_then_cancelled_updates_book():
+    listed = {
+        "event": "item_listed",
+        "topic": "collection:apes",
+        "payload": {"payload": {
+            "item": {"nft_id": f"ethereum/{CONTRACT}/7", "chain": {"name": "ethereum"}},
+            "order_hash": "0xlisted",
+            "base_price": "2000000000000000000",
+            "payment_token": {"decimals": 18},
+            "expiration_date": time.time() + 3600,
+        }},
+    }
+    opensea_stream.handle(listed, {"collection:apes": CONTRACT})
+    assert listings.book(CONTRACT).cheapest().price == pytest.approx(2.0)
+    cancelled = {"event": "item_cancelled", "topic": "collection:apes",
+                 "payload": {"payload": {"item": listed["payload"]["payload"]["item"], "order_hash": "0xlisted"}}}
+    opensea_stream.handle(cancelled, {"collection:apes": CONTRACT})
+    assert listings.book(CONTRACT).cheapest() is None
+
+
+def test_stream_stand_in_delivers_sales(monkeypatch):
+    """A local Phoenix-style server: join, push a sale, then drop the socket."""
+    joined = []
+
+    async def serve(ws):
+        joined.append(json.loads(await ws.recv())["topic"])
+        await ws.send(json.dumps(_sold(42, "0xorder42")))
+        await asyncio.sleep(0.2)
+
+    async def start():
+        return await websockets.serve(serve, "127.0.0.1", 0)
+
+    server = run_sync(start(), timeout=5)
+    port = server.sockets[0].getsockname()[1]
+
+    async def slug(contract):
+        return "apes"
+
+    monkeypatch.setattr(settings, "OPENSEA_STREAM", True)
+    monkeypatch.setattr(settings, "OPENSEA_API_KEY", "test-key")
+    monkeypatch.setattr(settings, "OPENSEA_STREAM_URL", f"ws://127.0.0.1:{port}/socket/websocket")
+    monkeypatch.setattr(opensea_stream, "contracts", lambda: [CONTRACT])
+    monkeypatch.setattr(listings, "_slug", slug)
+    try:
+        opensea_stream.start()
+        deadline = time.time() + 5
+        while time.time() < deadline and not len(trade_store.store(CONTRACT)):
+            time.sleep(0.05)
+    finally:
+        opensea_stream.stop()
+        server.close()
+        run_sync(server.wait_closed(), timeout=5)
+    assert joined == ["collection:apes"]
+    trade = trade_store.store(CONTRACT).trades()[0]
+    assert (trade.tx, trade.token, trade.buyer) == (TX, "42", "0xbuyer")
+    assert trade.usd == pytest.approx(3000.0)
+    assert opensea_stream.status()["events"] >= 1